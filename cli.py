@@ -23,15 +23,27 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import argparse
 import getpass
 import os
-import shutil
 import sqlite3
 import sys
+import time
 from d3lib.cmenu import run
+from d3lib.exporter import WRITERS, export_entries
+from d3lib.importer import import_entries, read_entries
+from d3lib.stats import create_stats, longest_entries, monthly_totals, totals
 from d3lib.dbtools import (
+    DEFAULT_PROFILE,
+    PROFILES,
+    backup_database,
+    bulk_profile,
+    diagnostics,
     open_database,
     create_database,
     valid_password,
-    change_password)
+    change_password,
+    migrate_to_blobs,
+    unlock,
+    upgrade_database,
+    verify_entries)
 
 __author__ = "Korvin F. Ezüst"
 __copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
@@ -57,6 +69,22 @@ if __name__ == "__main__":
     cp = "--change-password"
     # new archive - optional argument
     nd = "--new-database"
+    # convert entries to the current storage format - optional argument
+    mg = "--migrate"
+    # check the authentication tag of every entry - optional argument
+    vf = "--verify"
+    # show connection settings and database size - optional argument
+    dg = "--diagnostics"
+    # show word counts and the longest entries - optional argument
+    st = "--stats"
+    # import entries from a file or directory - optional argument with a
+    # value
+    im = "--import"
+    # export entries to a file or directory - optional argument with a
+    # value
+    ex = "--export"
+    # connection settings - optional argument with a value
+    pf = "--profile"
     # database - positional argument
     base = "database"
     # Set the main table name inside the database
@@ -65,7 +93,10 @@ if __name__ == "__main__":
     program_name = "D3TA (Dear Diary, Don't Tell Anyone)"
 
     # Set usage message
-    message = f"%(prog)s [-h] [{cp} | {nd}] {base}"
+    message = f"%(prog)s [-h] [{pf} {{{','.join(PROFILES)}}}] " \
+              f"[{cp} | {nd} | {mg} | {vf} | {dg} | {st} | {im} SOURCE | " \
+              f"{ex} TARGET [--format {{{','.join(WRITERS)}}}] " \
+              f"[--from DATE] [--to DATE]] {base}"
     parser = argparse.ArgumentParser(usage=message, description=program_name)
     parser.add_argument(base, help=f"[path +] filename to your {base}",
                         nargs="?")
@@ -75,6 +106,33 @@ if __name__ == "__main__":
                         help="show license boilerplate")
     parser.add_argument(nd, action="store_true", dest="new_database")
     parser.add_argument(cp, action="store_true", dest="change_pass")
+    parser.add_argument(mg, action="store_true", dest="migrate",
+                        help="convert entries to the current storage format")
+    parser.add_argument(vf, action="store_true", dest="verify",
+                        help="check every entry for corruption")
+    parser.add_argument(dg, action="store_true", dest="diagnostics",
+                        help="show connection settings and database size")
+    parser.add_argument(st, action="store_true", dest="stats",
+                        help="show word counts by month and the longest "
+                             "entries")
+    parser.add_argument(im, dest="import_from", metavar="SOURCE",
+                        help="import entries from a .jsonl or .csv file or "
+                             "a directory of dated text files")
+    parser.add_argument(ex, dest="export_to", metavar="TARGET",
+                        help="export entries to a .jsonl or .tar file, a "
+                             "directory of Markdown files or - (standard "
+                             "output)")
+    parser.add_argument("--format", choices=WRITERS, dest="export_format",
+                        help="export format, guessed from TARGET by default")
+    parser.add_argument("--from", dest="export_from", metavar="DATE",
+                        help="export entries from this date, e.g. "
+                             "2018-01-02")
+    parser.add_argument("--to", dest="export_until", metavar="DATE",
+                        help="export entries until this date")
+    parser.add_argument(pf, choices=PROFILES, default=DEFAULT_PROFILE,
+                        dest="profile",
+                        help=f"connection settings, default: "
+                             f"{DEFAULT_PROFILE}")
     args = parser.parse_args()
 
     # Get positional argument's attribute with getattr() because it cannot be
@@ -90,8 +148,10 @@ if __name__ == "__main__":
         sys.exit(f"{__file__}: error: "
                  f"the following arguments are required: database")
 
-    # Exit if both optional arguments are present
-    if args.new_database and args.change_pass:
+    # Exit if more than one optional argument is present
+    if args.new_database + args.change_pass + args.migrate + args.verify + \
+            args.diagnostics + args.stats + (args.import_from is not None) + \
+            (args.export_to is not None) > 1:
         sys.exit(parser.print_help())
 
     # Exit if database doesn't exist and not trying to create new
@@ -128,35 +188,150 @@ if __name__ == "__main__":
               f"continuing.")
         make_backup = input("Create one now? (Y/n) ")
         if make_backup not in ("n", "N"):
-            shutil.copyfile(database, database + ".bak")
-            print(f"'{database}.bak' created.")
+            if not backup_database(
+                    database, progress=lambda done, total: print(
+                        f"\r{100 * done // max(total, 1)}%", end="",
+                        flush=True)):
+                sys.exit(f"\n'{database}.bak' failed the integrity "
+                         f"check.")
+            print(f"\n'{database}.bak' created.")
         ready = input("Ready to continue? (y/N) ")
         if ready not in ("y", "Y"):
             sys.exit()
         # open database
-        with open_database(database) as cr:
+        with open_database(database, args.profile) as cr:
             password = getpass.getpass("Old Password: ")
             if valid_password(cr, password):
+                upgrade_database(cr, table)
                 # ask new password twice
                 new_password = getpass.getpass("New Password: ")
                 re_check = getpass.getpass("New Password again: ")
                 if re_check == new_password:
                     print("Changing password, re-encrypting all entries.\n"
                           "This could take a while...")
-                    change_password(cr, password, new_password, table)
-                    sys.exit("Password changed.")
+                    # one transaction, synced to the disk when it's
+                    # committed and rolled back if anything fails
+                    try:
+                        with bulk_profile(cr):
+                            change_password(
+                                cr, password, new_password, table,
+                                progress=lambda done, total: print(
+                                    f"\r{done}/{total}", end="",
+                                    flush=True))
+                    except ValueError as error:
+                        sys.exit(f"\nPassword didn't change. {error}")
+                    sys.exit("\nPassword changed.")
                 else:
                     sys.exit("Passwords don't match.")
             else:
                 sys.exit("Invalid password.")
+    # Convert entries to the current storage format and exit
+    if args.migrate:
+        with open_database(database, args.profile) as cr, \
+                bulk_profile(cr):
+            count = migrate_to_blobs(cr, table)
+        sys.exit(f"{count} entries converted.")
+
+    # Check every entry for corruption and exit
+    if args.verify:
+        with open_database(database, args.profile) as cr:
+            key = unlock(cr, getpass.getpass())
+            if key is None:
+                sys.exit("Invalid password.")
+            start = time.perf_counter()
+            count, size, corrupt, unverifiable = verify_entries(
+                cr, table, key)
+            seconds = time.perf_counter() - start
+        megabytes = size / 2 ** 20
+        print(f"{count} entries, {megabytes:.1f} MB checked in "
+              f"{seconds:.2f} s ({megabytes / max(seconds, 1e-9):.1f} MB/s).")
+        for dt in corrupt:
+            print(f"Corrupt: {dt}")
+        if unverifiable:
+            print(f"{len(unverifiable)} entries are stored in an older "
+                  f"format that can't be checked.")
+        sys.exit(f"{len(corrupt)} corrupt entries." if corrupt else 0)
+
+    # Import entries and exit
+    if args.import_from is not None:
+        if not os.path.exists(args.import_from):
+            sys.exit(f"'{args.import_from}' doesn't exist.")
+        with open_database(database, args.profile) as cr:
+            key = unlock(cr, getpass.getpass())
+            if key is None:
+                sys.exit("Invalid password.")
+            upgrade_database(cr, table, key)
+            start = time.perf_counter()
+            # everything or nothing is imported, synced to the disk
+            # when it's committed
+            try:
+                with bulk_profile(cr):
+                    count, moved = import_entries(
+                        cr, table, key, read_entries(args.import_from))
+            except (ValueError, KeyError) as error:
+                sys.exit(f"Nothing imported from '{args.import_from}', "
+                         f"{error}")
+            seconds = time.perf_counter() - start
+        print(f"{count} entries imported in {seconds:.2f} s "
+              f"({count / max(seconds, 1e-9):.0f} entries/s).")
+        if moved:
+            print(f"{moved} entries got a later date, their date was taken.")
+        sys.exit()
+
+    # Export entries and exit
+    if args.export_to is not None:
+        with open_database(database, args.profile) as cr:
+            key = unlock(cr, getpass.getpass())
+            if key is None:
+                sys.exit("Invalid password.")
+            count, size, seconds = export_entries(
+                cr, table, key, args.export_to, args.export_format,
+                args.export_from, args.export_until)
+        megabytes = size / 2 ** 20
+        # the report doesn't go to the standard output, the export may
+        print(f"{count} entries, {megabytes:.1f} MB exported in "
+              f"{seconds:.2f} s ({count / max(seconds, 1e-9):.0f} entries/s, "
+              f"{megabytes / max(seconds, 1e-9):.1f} MB/s).", file=sys.stderr)
+        sys.exit()
+
+    # Show connection settings and database size and exit
+    if args.diagnostics:
+        with open_database(database, args.profile) as cr:
+            for name, value in diagnostics(cr).items():
+                print(f"{name}: {value}")
+        sys.exit()
+
+    # Show word counts by month and the longest entries and exit
+    if args.stats:
+        with open_database(database, args.profile) as cr:
+            key = unlock(cr, getpass.getpass())
+            if key is None:
+                sys.exit("Invalid password.")
+            upgrade_database(cr, table, key)
+            # only the entries missing from the statistics are decrypted
+            create_stats(cr, table, key, progress=lambda done, total: print(
+                f"\rCounting {done}/{total}", end="", flush=True))
+            total = totals(cr, table)
+            months = monthly_totals(cr, table)
+            longest = longest_entries(cr, table)
+        print(f"\r{total['entries']} entries, about {total['words']} words, "
+              f"{total['chars']} characters, {total['lines']} lines.")
+        for month, count, words, chars, lines, size in months:
+            print(f"{month}: {count} entries, about {words} words")
+        print("Longest entries:")
+        for dt, ht, words in longest:
+            print(f"{dt} ({ht}): about {words} words")
+        sys.exit()
+
     # Open database
     try:
-        with open_database(database) as cr:
-            password = getpass.getpass()
-            if not valid_password(cr, password):
+        with open_database(database, args.profile) as cr:
+            key = unlock(cr, getpass.getpass())
+            if key is None:
                 sys.exit("Invalid password.")
 
-            run(cr, table, password)
+            upgrade_database(cr, table, key)
+            run(cr, table, key)
     except sqlite3.DatabaseError:
         sys.exit(f"{database} is not a valid database or "
                  f"you don't have the necessary permissions to open it.")
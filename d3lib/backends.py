@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import importlib
+import os
+import time
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+BLOCK_SIZE = 16
+
+# Environment variable naming the backend to use instead of the fastest
+ENVIRONMENT = "D3TA_BACKEND"
+
+# Number of bytes encrypted by each backend when looking for the fastest
+PROBE_SIZE = 1 << 20
+
+# AES-256 CBC test vector from NIST SP 800-38A, F.2.5
+_KEY = bytes.fromhex(
+    "603deb1015ca71be2b73aef0857d77811f352c073b6108d72d9810a30914dff4")
+_IV = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+_PLAIN = bytes.fromhex("6bc1bee22e409f96e93d7e117393172a")
+_CIPHER = bytes.fromhex("f58c4c04d6e5f1ba779eabfb5f7bfbd6")
+
+
+class PyCrypto:
+    """
+    AES-CBC from PyCrypto, or from PyCryptodome installed as its drop-in
+    replacement in package Crypto.
+    PyCryptodome 3.7+ encrypts into preallocated buffers.
+    """
+
+    name = "pycrypto"
+    package = "Crypto"
+
+    def __init__(self):
+        module = importlib.import_module(self.package)
+        self.aes = importlib.import_module(self.package + ".Cipher.AES")
+        self.output = getattr(module, "version_info", (0,)) >= (3, 7)
+
+    def encrypt_into(self, key, iv, source, last, target):
+        """
+        Encrypts whole blocks followed by an already padded last block
+
+        :param key: AES key
+        :type key: bytes
+        :param iv: initialization vector
+        :type iv: bytes
+        :param source: whole blocks to be encrypted
+        :type source: memoryview
+        :param last: last block
+        :type last: bytes
+        :param target: buffer of len(source) + BLOCK_SIZE bytes
+        :type target: memoryview
+        """
+        cip = self.aes.new(key, self.aes.MODE_CBC, iv)
+        if self.output:
+            cip.encrypt(source, output=target[:-BLOCK_SIZE])
+            cip.encrypt(last, output=target[-BLOCK_SIZE:])
+        else:
+            target[:-BLOCK_SIZE] = cip.encrypt(bytes(source))
+            target[-BLOCK_SIZE:] = cip.encrypt(last)
+
+    def decrypt(self, key, iv, source):
+        """
+        Decrypts whole blocks
+
+        :param key: AES key
+        :type key: bytes
+        :param iv: initialization vector
+        :type iv: bytes
+        :param source: encrypted data
+        :type source: memoryview
+        :return: decrypted data, still padded
+        :rtype: bytes-like object
+        """
+        cip = self.aes.new(key, self.aes.MODE_CBC, iv)
+        if self.output:
+            data = bytearray(len(source))
+            cip.decrypt(source, output=data)
+            return data
+        return cip.decrypt(bytes(source))
+
+
+class PyCryptodome(PyCrypto):
+    """
+    AES-CBC from PyCryptodome installed side by side with PyCrypto, in
+    package Cryptodome
+    """
+
+    name = "pycryptodome"
+    package = "Cryptodome"
+
+
+class Cryptography:
+    """
+    AES-CBC from cryptography, i.e. OpenSSL, using AES-NI where the CPU
+    has it
+    """
+
+    name = "cryptography"
+
+    def __init__(self):
+        from cryptography.hazmat.primitives.ciphers import (
+            Cipher, algorithms, modes)
+        self.cipher = Cipher
+        self.algorithm = algorithms.AES
+        self.mode = modes.CBC
+        # Older versions need the backend argument
+        try:
+            from cryptography.hazmat.backends import default_backend
+            self.backend = default_backend()
+        except ImportError:
+            self.backend = None
+
+    def _cipher(self, key, iv):
+        return self.cipher(self.algorithm(key), self.mode(iv), self.backend)
+
+    def encrypt_into(self, key, iv, source, last, target):
+        """
+        Encrypts whole blocks followed by an already padded last block
+
+        :param key: AES key
+        :type key: bytes
+        :param iv: initialization vector
+        :type iv: bytes
+        :param source: whole blocks to be encrypted
+        :type source: memoryview
+        :param last: last block
+        :type last: bytes
+        :param target: buffer of len(source) + BLOCK_SIZE bytes
+        :type target: memoryview
+        """
+        cip = self._cipher(key, iv).encryptor()
+        # update_into() wants room for one more block than it writes
+        cip.update_into(source, target)
+        target[-BLOCK_SIZE:] = cip.update(last)
+        cip.finalize()
+
+    def decrypt(self, key, iv, source):
+        """
+        Decrypts whole blocks
+
+        :param key: AES key
+        :type key: bytes
+        :param iv: initialization vector
+        :type iv: bytes
+        :param source: encrypted data
+        :type source: memoryview
+        :return: decrypted data, still padded
+        :rtype: bytes-like object
+        """
+        cip = self._cipher(key, iv).decryptor()
+        data = bytearray(len(source) + BLOCK_SIZE - 1)
+        size = cip.update_into(source, data)
+        cip.finalize()
+        # Shrinking from the end doesn't copy
+        del data[size:]
+        return data
+
+
+# Every backend in order of preference when they are equally fast
+BACKENDS = (Cryptography, PyCryptodome, PyCrypto)
+
+_selected = None
+
+
+def _works(backend):
+    """
+    Checks a backend against a known ciphertext
+
+    :param backend: backend instance
+    :type backend: object
+    :return: True|False
+    :rtype: bool
+    """
+    target = bytearray(2 * BLOCK_SIZE)
+    backend.encrypt_into(_KEY, _IV, memoryview(_PLAIN), _PLAIN,
+                         memoryview(target))
+    return target[:BLOCK_SIZE] == _CIPHER and \
+        backend.decrypt(_KEY, _IV, memoryview(target))[:BLOCK_SIZE] == _PLAIN
+
+
+def available():
+    """
+    Returns every backend that is installed and encrypts correctly
+
+    :return: list of backend instances
+    :rtype: list
+    """
+    backends = []
+    for cls in BACKENDS:
+        try:
+            backend = cls()
+        except ImportError:
+            continue
+        if _works(backend):
+            backends.append(backend)
+    return backends
+
+
+def throughput(backend, size=PROBE_SIZE):
+    """
+    Measures how fast a backend encrypts
+
+    :param backend: backend instance
+    :type backend: object
+    :param size: number of bytes encrypted
+    :type size: int
+    :return: bytes per second
+    :rtype: float
+    """
+    source = memoryview(bytes(size))
+    target = memoryview(bytearray(size + BLOCK_SIZE))
+    start = time.perf_counter()
+    backend.encrypt_into(_KEY, _IV, source, _PLAIN, target)
+    return size / max(time.perf_counter() - start, 1e-9)
+
+
+def select(name=None):
+    """
+    Selects the backend used by d3lib.crypter.
+    Without a name the one in environment variable D3TA_BACKEND is used if
+    set, otherwise the fastest installed one.
+
+    :param name: "cryptography", "pycryptodome" or "pycrypto"
+    :type name: str
+    :return: selected backend instance
+    :rtype: object
+    """
+    global _selected
+    name = name or os.environ.get(ENVIRONMENT)
+    backends = available()
+    if not backends:
+        raise ImportError("No AES backend found, install cryptography, "
+                          "pycryptodome or pycrypto...")
+    if name:
+        matching = [b for b in backends if b.name == name]
+        if not matching:
+            raise ValueError(f"AES backend {name} is not available...")
+        _selected = matching[0]
+    elif len(backends) == 1:
+        _selected = backends[0]
+    else:
+        _selected = max(backends, key=throughput)
+    return _selected
+
+
+def backend():
+    """
+    Returns the selected backend, selecting one on first use
+
+    :return: backend instance
+    :rtype: object
+    """
+    if _selected is None:
+        return select()
+    return _selected
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import time
+from .crypter import (
+    CODEC_LZMA,
+    CODEC_NONE,
+    CODEC_ZLIB,
+    FORMAT_COMPRESSED,
+    SessionKey,
+    encrypt,
+    decrypt,
+    encrypt_entry,
+    decrypt_entry,
+    encrypt_many,
+    decrypt_many)
+from .backends import BLOCK_SIZE, available, backend, select, throughput
+from .parallel import reencrypt_rows
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Entry sizes in bytes measured by crypter_suite()
+SIZES = (100, 1000, 10000, 100000, 1000000, 10000000, 50000000)
+
+
+def per_entry(func, count):
+    """
+    Runs a function and returns the time it took divided by 'count'
+
+    :param func: function to be timed, takes no arguments
+    :type func: function
+    :param count: number of entries the function processes
+    :type count: int
+    :return: seconds per entry
+    :rtype: float
+    """
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) / count
+
+
+def best_of(func, repeat=3):
+    """
+    Runs a function 'repeat' times and returns the shortest run time
+
+    :param func: function to be timed, takes no arguments
+    :type func: function
+    :param repeat: number of runs
+    :type repeat: int
+    :return: seconds
+    :rtype: float
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def stage_times(size, repeat=3):
+    """
+    Measures the stages of storing and reading an entry separately
+
+    :param size: entry size in bytes
+    :type size: int
+    :param repeat: number of runs, the shortest one counts
+    :type repeat: int
+    :return: seconds spent in key derivation, UTF-8 encoding and decoding,
+             padding, AES encryption and decryption, base64 encoding and
+             decoding and HMAC
+    :rtype: dict
+    """
+    psw = "benchmark passphrase"
+    text = "x" * size
+    data = text.encode("utf-8")
+    key = SessionKey(psw)
+    cipher = backend()
+    iv = os.urandom(BLOCK_SIZE)
+    padding = BLOCK_SIZE - len(data) % BLOCK_SIZE
+    padded = memoryview(data + bytes([padding]) * padding)
+    encrypted = bytearray(len(padded))
+    target = memoryview(encrypted)
+    last = bytes(padded[-BLOCK_SIZE:])
+    cipher.encrypt_into(key.aes, iv, padded[:-BLOCK_SIZE], last, target)
+    encoded = base64.b64encode(iv + encrypted)
+    return {
+        "key_derivation": best_of(lambda: SessionKey(psw), repeat),
+        "utf8_encode": best_of(lambda: text.encode("utf-8"), repeat),
+        "utf8_decode": best_of(lambda: data.decode("utf-8"), repeat),
+        "padding": best_of(
+            lambda: data + bytes([padding]) * padding, repeat),
+        "aes_encrypt": best_of(
+            lambda: cipher.encrypt_into(
+                key.aes, iv, padded[:-BLOCK_SIZE], last, target),
+            repeat),
+        "aes_decrypt": best_of(
+            lambda: cipher.decrypt(key.aes, iv, target), repeat),
+        "base64_encode": best_of(
+            lambda: base64.b64encode(iv + encrypted), repeat),
+        "base64_decode": best_of(lambda: base64.b64decode(encoded), repeat),
+        "hmac": best_of(
+            lambda: hmac.new(key.mac, encrypted, hashlib.sha256).digest(),
+            repeat),
+    }
+
+
+def crypter_suite(sizes=SIZES, repeat=3, batch_bytes=8 * 2 ** 20):
+    """
+    Measures encryption and decryption latency and throughput of entries
+    in the current storage format (without compression), one entry at a
+    time with a password and in batches with a session key, and the time
+    spent in each stage
+
+    :param sizes: entry sizes in bytes
+    :type sizes: tuple
+    :param repeat: number of runs, the shortest one counts
+    :type repeat: int
+    :param batch_bytes: approximate number of bytes in a batch
+    :type batch_bytes: int
+    :return: one dictionary of results for each size
+    :rtype: list
+    """
+    psw = "benchmark passphrase"
+    results = []
+    for size in sizes:
+        megabytes = size / 2 ** 20
+        text = "x" * size
+        stored = encrypt_entry(psw, text, CODEC_NONE)
+        single_enc = best_of(
+            lambda: encrypt_entry(psw, text, CODEC_NONE), repeat)
+        single_dec = best_of(lambda: decrypt_entry(psw, stored), repeat)
+
+        count = max(1, min(1000, batch_bytes // size))
+        key = SessionKey(psw)
+        entries = [text] * count
+        batch = list(encrypt_many(key, entries, FORMAT_COMPRESSED,
+                                  CODEC_NONE))
+        batch_enc = best_of(lambda: list(encrypt_many(
+            key, entries, FORMAT_COMPRESSED, CODEC_NONE)), repeat) / count
+        batch_dec = best_of(
+            lambda: list(decrypt_many(key, batch)), repeat) / count
+
+        results.append({
+            "size": size,
+            "single": {
+                "encrypt_s": single_enc,
+                "decrypt_s": single_dec,
+                "encrypt_mb_s": megabytes / single_enc,
+                "decrypt_mb_s": megabytes / single_dec,
+            },
+            "batched": {
+                "entries": count,
+                "encrypt_s_per_entry": batch_enc,
+                "decrypt_s_per_entry": batch_dec,
+                "encrypt_mb_s": megabytes / batch_enc,
+                "decrypt_mb_s": megabytes / batch_dec,
+            },
+            "stages_s": stage_times(size, repeat),
+        })
+    return results
+
+
+def write_json(results, file):
+    """
+    Writes benchmark results with a description of the machine as JSON
+
+    :param results: benchmark results by name
+    :type results: dict
+    :param file: filename
+    :type file: str
+    """
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "backend": backend().name,
+        "results": results,
+    }
+    with open(file, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def batch_overhead(counts=(10000, 100000), size=100):
+    """
+    Compares per-entry times of encrypt()/decrypt() called in a loop
+    with encrypt_many()/decrypt_many() for small entries
+
+    :param counts: numbers of entries to be measured
+    :type counts: tuple
+    :param size: entry size in characters
+    :type size: int
+    :return: list of tuples containing the number of entries and the
+             per-entry microseconds of single encrypt, batched encrypt,
+             single decrypt and batched decrypt
+    :rtype: list
+    """
+    psw = "benchmark passphrase"
+    results = []
+    for count in counts:
+        entries = ["x" * size] * count
+        encrypted = list(encrypt_many(psw, entries))
+        single_enc = per_entry(
+            lambda: [encrypt(psw, e) for e in entries], count)
+        batch_enc = per_entry(
+            lambda: list(encrypt_many(psw, entries)), count)
+        single_dec = per_entry(
+            lambda: [decrypt(psw, e) for e in encrypted], count)
+        batch_dec = per_entry(
+            lambda: list(decrypt_many(psw, encrypted)), count)
+        results.append((count, single_enc * 1e6, batch_enc * 1e6,
+                        single_dec * 1e6, batch_dec * 1e6))
+    return results
+
+
+def parallel_scaling(count=200000, size=100, workers=(1, 2, 4, 8)):
+    """
+    Measures re-encrypting rows with reencrypt_rows() using different
+    numbers of worker processes
+
+    :param count: number of rows
+    :type count: int
+    :param size: entry size in characters
+    :type size: int
+    :param workers: numbers of worker processes to be measured
+    :type workers: tuple
+    :return: list of tuples containing the number of workers, rows per
+             second and speedup compared to the first measurement
+    :rtype: list
+    """
+    rows = [(str(i), "", ent) for i, ent in enumerate(
+        encrypt_many("old", ["x" * size] * count))]
+    results = []
+    for w in workers:
+        seconds = per_entry(
+            lambda: list(reencrypt_rows("old", "new", rows, workers=w)),
+            count) * count
+        speedup = count / seconds / results[0][1] if results else 1.0
+        results.append((w, count / seconds, speedup))
+    return results
+
+
+def synthetic_corpus(count=1000, size=4000, seed=2018):
+    """
+    Generates diary-like prose, sentences of common English words
+
+    :param count: number of entries
+    :type count: int
+    :param size: approximate entry size in characters
+    :type size: int
+    :param seed: random seed, the same seed gives the same corpus
+    :type seed: int
+    :return: list of entries
+    :rtype: list
+    """
+    words = ("i we you they it the a an and but or so because today "
+             "yesterday tomorrow morning evening night went came saw felt "
+             "thought said walked worked talked home office park city "
+             "friend mother father sister brother dog cat rain sun coffee "
+             "tea book movie music dinner lunch breakfast happy tired "
+             "busy quiet long short good bad little very really again "
+             "still never always something nothing about with without "
+             "after before while then when where why how was were had "
+             "have will would could should").split()
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        sentences = []
+        length = 0
+        while length < size:
+            sentence = " ".join(
+                rng.choice(words) for _ in range(rng.randint(5, 20)))
+            sentence = sentence.capitalize() + ". "
+            sentences.append(sentence)
+            length += len(sentence)
+        corpus.append("".join(sentences))
+    return corpus
+
+
+def codec_report(count=1000, size=4000):
+    """
+    Compares the stored size and the encryption and decryption throughput
+    of the compression codecs on a synthetic corpus
+
+    :param count: number of entries
+    :type count: int
+    :param size: approximate entry size in characters
+    :type size: int
+    :return: list of tuples containing the codec name, the stored size
+             relative to the text, encryption and decryption MB/s
+    :rtype: list
+    """
+    psw = "benchmark passphrase"
+    corpus = synthetic_corpus(count, size)
+    megabytes = sum(len(e.encode("utf-8")) for e in corpus) / 2 ** 20
+    results = []
+    for name, codec in (("none", CODEC_NONE), ("zlib", CODEC_ZLIB),
+                        ("lzma", CODEC_LZMA)):
+        encrypted = []
+        enc = per_entry(lambda: encrypted.extend(encrypt_many(
+            psw, corpus, FORMAT_COMPRESSED, codec)), 1)
+        dec = per_entry(lambda: list(decrypt_many(psw, encrypted)), 1)
+        stored = sum(len(e) for e in encrypted) / 2 ** 20
+        results.append((name, stored / megabytes, megabytes / enc,
+                        megabytes / dec))
+    return results
+
+
+def backend_report(size=16 * 2 ** 20, count=1000, entry_size=4000):
+    """
+    Compares the AES backends installed, raw encryption throughput and
+    entries re-encrypted per second by each of them
+
+    :param size: number of bytes encrypted at once
+    :type size: int
+    :param count: number of entries re-encrypted
+    :type count: int
+    :param entry_size: approximate entry size in characters
+    :type entry_size: int
+    :return: list of tuples containing the backend name, raw MB/s and
+             entries re-encrypted per second
+    :rtype: list
+    """
+    old = SessionKey("benchmark passphrase")
+    new = SessionKey("new benchmark passphrase")
+    corpus = list(encrypt_many(old, synthetic_corpus(count, entry_size),
+                               FORMAT_COMPRESSED))
+    selected = backend().name
+    results = []
+    try:
+        for cipher in available():
+            select(cipher.name)
+            raw = max(throughput(cipher, size) for _ in range(3))
+            elapsed = per_entry(lambda: list(encrypt_many(
+                new, decrypt_many(old, corpus), FORMAT_COMPRESSED)), 1)
+            results.append((cipher.name, raw / 2 ** 20, count / elapsed))
+    finally:
+        select(selected)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="D3TA crypter benchmarks")
+    parser.add_argument("suites", nargs="*",
+                        choices=["crypter", "batch", "parallel", "codecs",
+                                 "backends"],
+                        default=["crypter", "batch", "parallel", "codecs",
+                                 "backends"])
+    parser.add_argument("--json", help="write results to a JSON file")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="entry sizes in bytes for the crypter suite")
+    args = parser.parse_args()
+    report = {}
+
+    if "crypter" in args.suites:
+        report["crypter"] = crypter_suite(args.sizes)
+        print(f"{'size':>10} {'enc ms':>10} {'dec ms':>10} "
+              f"{'enc MB/s':>10} {'dec MB/s':>10} {'batch enc':>10} "
+              f"{'batch dec':>10}")
+        for row in report["crypter"]:
+            print(f"{row['size']:>10} "
+                  f"{row['single']['encrypt_s'] * 1e3:>10.3f} "
+                  f"{row['single']['decrypt_s'] * 1e3:>10.3f} "
+                  f"{row['single']['encrypt_mb_s']:>10.1f} "
+                  f"{row['single']['decrypt_mb_s']:>10.1f} "
+                  f"{row['batched']['encrypt_mb_s']:>10.1f} "
+                  f"{row['batched']['decrypt_mb_s']:>10.1f}")
+        print()
+    if "batch" in args.suites:
+        report["batch"] = batch_overhead()
+        print(f"{'entries':>8} {'encrypt':>10} {'enc_many':>10} "
+              f"{'decrypt':>10} {'dec_many':>10}  (µs per entry)")
+        for row in report["batch"]:
+            print(f"{row[0]:>8} {row[1]:>10.2f} {row[2]:>10.2f} "
+                  f"{row[3]:>10.2f} {row[4]:>10.2f}")
+        print()
+    if "parallel" in args.suites:
+        report["parallel"] = parallel_scaling()
+        print(f"{'workers':>8} {'rows/s':>12} {'speedup':>8}")
+        for row in report["parallel"]:
+            print(f"{row[0]:>8} {row[1]:>12.0f} {row[2]:>8.2f}")
+        print()
+    if "codecs" in args.suites:
+        report["codecs"] = codec_report()
+        print(f"{'codec':>8} {'size':>8} {'enc MB/s':>10} {'dec MB/s':>10}")
+        for row in report["codecs"]:
+            print(f"{row[0]:>8} {row[1]:>8.1%} {row[2]:>10.1f} "
+                  f"{row[3]:>10.1f}")
+        print()
+    if "backends" in args.suites:
+        report["backends"] = backend_report()
+        print(f"{'backend':>14} {'AES MB/s':>10} {'re-enc/s':>10}")
+        for row in report["backends"]:
+            print(f"{row[0]:>14} {row[1]:>10.1f} {row[2]:>10.0f}")
+        print()
+
+    if args.json:
+        write_json(report, args.json)
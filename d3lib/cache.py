@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Number of bytes of decrypted text kept by default
+DEFAULT_BUDGET = 32 * 2 ** 20
+
+# Number of bytes at the end of an encrypted entry identifying it, every
+# write gets a new IV, so the last block and the tag change with it
+FINGERPRINT_SIZE = 16
+
+
+class EntryCache:
+    """
+    Decrypted entries by date, the least recently used ones are dropped
+    when the texts take more than 'budget' bytes.
+    Each text is kept with the fingerprint of the encrypted entry it came
+    from, and is only returned for the same fingerprint, so an entry
+    changed by another connection is decrypted again.
+    Texts are kept as UTF-8 in buffers that are overwritten with zeros when
+    they leave the cache.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        """
+        :param budget: maximum number of bytes of text, 0 turns caching off
+        :type budget: int
+        """
+        self.budget = budget
+        # Number of bytes of text kept
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Tuples containing a fingerprint and a bytearray by date, least
+        # recently used first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, dt):
+        return dt in self._entries
+
+    @staticmethod
+    def _wipe(data):
+        data[:] = bytes(len(data))
+
+    def _drop(self, dt):
+        fingerprint, data = self._entries.pop(dt)
+        self.size -= len(data)
+        self._wipe(data)
+
+    def get(self, dt, fingerprint):
+        """
+        Returns a cached text
+
+        :param dt: datetime
+        :type dt: str
+        :param fingerprint: end of the encrypted entry, see FINGERPRINT_SIZE
+        :type fingerprint: bytes|str
+        :return: decrypted entry, None if not cached
+        :rtype: str
+        """
+        cached = self._entries.get(dt)
+        if cached is None or cached[0] != fingerprint:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(dt)
+        self.hits += 1
+        return cached[1].decode("utf-8")
+
+    def put(self, dt, fingerprint, text):
+        """
+        Caches a text, dropping the least recently used ones until it fits.
+        Texts bigger than the whole budget aren't cached.
+
+        :param dt: datetime
+        :type dt: str
+        :param fingerprint: end of the encrypted entry, see FINGERPRINT_SIZE
+        :type fingerprint: bytes|str
+        :param text: decrypted entry
+        :type text: str
+        """
+        if dt in self._entries:
+            self._drop(dt)
+        data = bytearray(text, "utf-8")
+        if len(data) > self.budget:
+            self._wipe(data)
+            return
+        while self.size + len(data) > self.budget:
+            self._drop(next(iter(self._entries)))
+        self._entries[dt] = fingerprint, data
+        self.size += len(data)
+
+    def invalidate(self, dt):
+        """
+        Drops the text of an entry that is written or deleted
+
+        :param dt: datetime
+        :type dt: str
+        """
+        if dt in self._entries:
+            self._drop(dt)
+
+    def clear(self):
+        """Drops every text, e.g. when the diary is locked or closed"""
+        for fingerprint, data in self._entries.values():
+            self._wipe(data)
+        self._entries.clear()
+        self.size = 0
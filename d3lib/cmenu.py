@@ -24,12 +24,16 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import time
 import urwid
 from .dbtools import (
-    create_main_table,
     add_entry,
-    single_entry,
-    all_entry_names,
+    calendar_entries,
+    entry_stream,
+    list_entries,
+    PAGE_SIZE,
     delete_entry,
-    delete_table)
+    delete_all_entries,
+    update_entry)
+from .revisions import revision_list, revision_text
+from .search import search_entries
 from .text import edit
 
 __author__ = "Korvin F. Ezüst"
@@ -41,17 +45,28 @@ __status__ = "Production"
 
 selected_item = ""
 text_entry = ""
+# Words searched for, None lists every entry
+search_query = None
+# Year, month or day listed, e.g. "2018-01", None lists every entry
+calendar_query = None
+option_all = "All entries..."
+option_calendar = "Calendar..."
 option_back = "Back..."
 option_delete = "Delete..."
 option_delete_all = "Delete all..."
 option_exit = "Exit..."
+option_more = "More entries..."
 option_new_entry = "New entry..."
 option_new_entry_with_hint = "New entry with hint..."
+option_restore = "Restore"
+option_revisions = "Revisions..."
+option_search = "Search..."
 option_view_edit = "View/Edit..."
 option_yes = "Yes"
 option_yes_all = "Delete everything"
 option_no = "No"
-submenu_options = [option_back, option_view_edit, option_delete]
+submenu_options = [option_back, option_view_edit, option_revisions,
+                   option_delete]
 
 
 def datetime():
@@ -72,26 +87,28 @@ def option_handler(button, tuple_):
     :param button: button clicked
     :type button: urwid.Button
     :param tuple_: holds the selected item, the sqlite3.Cursor, the table name
-    and the password
+    and the session key
     :type tuple_: tuple
     """
     item = tuple_[0]
     c = tuple_[1]
     tb = tuple_[2]
-    psw = tuple_[3]
+    key = tuple_[3]
 
     global selected_item
     global option_new_entry, option_new_entry_with_hint, option_delete_all
     global option_view_edit, option_delete
     global option_yes, option_no, option_yes_all
-    global text_entry
+    global option_search, option_all, option_calendar
+    global option_revisions, option_restore
+    global text_entry, search_query, calendar_query
 
     # Create a new entry using the text editor
     if item == option_new_entry:
         # create entry
         text_entry = edit.main("ENTRY")
         # add it to the database
-        add_entry(c, tb, datetime(), psw, text_entry)
+        add_entry(c, tb, datetime(), key, text_entry)
     # Create a new entry with hint using the text editor
     elif item == option_new_entry_with_hint:
         # create hint
@@ -103,38 +120,73 @@ def option_handler(button, tuple_):
         # create entry
         text_entry = edit.main("ENTRY")
         # Add entry with hint to database
-        add_entry(c, tb, datetime(), psw, text_entry, hint)
+        add_entry(c, tb, datetime(), key, text_entry, hint)
+    # Search entries using the text editor, e.g. "walk* park"
+    elif item == option_search:
+        query = edit.main("SEARCH").replace("\n", " ").strip()
+        search_query = query or None
+        calendar_query = None
+        selected_item = item
+    # List the entries of a year, a month or a day, this day of every year
+    # by default
+    elif item == option_calendar:
+        query = edit.main(time.strftime("%m-%d")).replace("\n", " ").strip()
+        calendar_query = query
+        search_query = None
+        selected_item = item
+    # List every entry again
+    elif item == option_all:
+        search_query = None
+        calendar_query = None
+        selected_item = item
     # Open existing entry in text editor
     elif item == option_view_edit:
         # get date from item's name
         dt = selected_item[:19]
-        # get hint from item's name
-        hint = selected_item[21:-1]
-        # get decrypted text
-        text_entry = single_entry(c, tb, dt, psw)
-        # open decrypted text in text editor
-        text_entry = edit.main(text_entry)
-        # replace entry
-        delete_entry(c, tb, dt)
-        add_entry(c, tb, dt, psw, text_entry, hint)
+        # open decrypted text in text editor,
+        # it is decrypted as the editor reads it
+        text_entry = edit.main(entry_stream(c, tb, dt, key))
+        # store the text if it changed, the hint stays
+        update_entry(c, tb, dt, key, text_entry)
+    # Open an earlier text of an entry in the text editor
+    elif item == option_revisions:
+        # get date from item's name
+        dt = selected_item[:19]
+        revisions = revision_list(c, tb, dt)
+        names = [f"{number}: saved {saved}"
+                 for number, saved, snapshot, size in revisions]
+        # choose a revision, the chosen name is stored to selected_item
+        title = f"Revisions of {dt}" if names else \
+            f"{dt} has never been changed"
+        loop(title, [option_back] + names, c, tb, key)
+        if selected_item in names:
+            number = revisions[names.index(selected_item)][0]
+            text_entry = edit.main(revision_text(c, tb, key, dt, number))
+            # ask for confirmation, the editor always saves
+            selected_item = dt
+            loop(f"Restore revision {number} of {dt}?",
+                 [option_restore, option_no], c, tb, key)
+        selected_item = ""
+    # Confirmation to restore a revision, it is saved as the latest one
+    elif item == option_restore:
+        update_entry(c, tb, selected_item, key, text_entry)
     # Delete entry
     elif item == option_delete:
         # get date from item's name
         selected_item = selected_item[:19]
         # ask for confirmation
-        loop(f"Delete {selected_item}?", [option_yes, option_no], c, tb, psw)
+        loop(f"Delete {selected_item}?", [option_yes, option_no], c, tb, key)
     # Confirmation to delete entry
     elif item == option_yes:
         delete_entry(c, tb, selected_item)
     # Delete all entries
     elif item == option_delete_all:
         # ask for confirmation
-        loop(f"Delete everything?", [option_yes_all, option_no], c, tb, psw)
+        loop(f"Delete everything?", [option_yes_all, option_no], c, tb, key)
     # Confirmation to delete all entries
     elif item == option_yes_all:
         # recreate table in database
-        delete_table(c, tb)
-        create_main_table(c, tb)
+        delete_all_entries(c, tb)
         selected_item = ""
     # No confirmation
     elif item == option_no:
@@ -147,7 +199,7 @@ def option_handler(button, tuple_):
     raise urwid.ExitMainLoop
 
 
-def menu(title, items, c, tb, psw):
+def menu(title, items, c, tb, key):
     """
     Creates the menu as buttons
 
@@ -159,8 +211,8 @@ def menu(title, items, c, tb, psw):
     :type c: sqlite3.Cursor
     :param tb: table
     :type tb: str
-    :param psw: password
-    :type psw: str
+    :param key: session key
+    :type key: d3lib.crypter.SessionKey
     :return: list of menu items as buttons
     :rtype: urwid.SimpleListWalker
     """
@@ -174,9 +226,9 @@ def menu(title, items, c, tb, psw):
             pass
         else:
             # connect the button to option_handler
-            # pass in i, c, tb and psw as a tuple
+            # pass in i, c, tb and key as a tuple
             urwid.connect_signal(
-                button, "click", option_handler, (i, c, tb, psw))
+                button, "click", option_handler, (i, c, tb, key))
         # Append button to body
         body.append(urwid.AttrMap(button, None, focus_map="reversed"))
     return urwid.SimpleListWalker(body)
@@ -198,7 +250,7 @@ def make_overlay(body):
         min_width=20, min_height=8)
 
 
-def loop(title, items, c, tb, psw):
+def loop(title, items, c, tb, key):
     """
     Creates the main loop
 
@@ -210,11 +262,11 @@ def loop(title, items, c, tb, psw):
     :type c: sqlite3.Cursor
     :param tb: table
     :type tb: str
-    :param psw: password
-    :type psw: str
+    :param key: session key
+    :type key: d3lib.crypter.SessionKey
     """
     # Create body
-    body = urwid.ListBox(menu(title, items, c, tb, psw))
+    body = urwid.ListBox(menu(title, items, c, tb, key))
     # Create overlay
     overlay = make_overlay(body)
     # Create palette
@@ -223,7 +275,7 @@ def loop(title, items, c, tb, psw):
     urwid.MainLoop(overlay, palette).run()
 
 
-def run(c, tb, psw):
+def run(c, tb, key):
     """
     Run program
 
@@ -231,29 +283,70 @@ def run(c, tb, psw):
     :type c: sqlite3.Cursor
     :param tb: table
     :type tb: str
-    :param psw: password
-    :type psw: str
+    :param key: session key
+    :type key: d3lib.crypter.SessionKey
     """
     global option_new_entry, option_new_entry_with_hint, option_exit
-    global option_delete_all, selected_item
+    global option_delete_all, option_more, selected_item
+    global option_search, option_all, search_query
+    global option_calendar, calendar_query
     global submenu_options
 
+    # Names of the entries listed, a page at first and one more page every
+    # time option_more is clicked
+    names = list_entries(c, tb, limit=PAGE_SIZE)
     # Restart main loop until option_exit is clicked
     while selected_item != option_exit:
+        title = "D3TA"
+        if search_query is not None:
+            # list the entries found, the index is created on the first
+            # search
+            try:
+                names = search_entries(
+                    c, tb, key, search_query,
+                    progress=lambda done, total: print(
+                        f"\rIndexing {done}/{total}", end="", flush=True))
+                title = f"D3TA - {len(names)} found: {search_query}"
+            except ValueError as error:
+                names = []
+                title = f"D3TA - {error}"
+        elif calendar_query is not None:
+            # list the entries of the dates asked for, from the index of
+            # the dates
+            try:
+                names = calendar_entries(c, tb, calendar_query)
+                title = f"D3TA - {len(names)} on {calendar_query or 'today'}"
+            except ValueError as error:
+                names = []
+                title = f"D3TA - {error}"
+        elif selected_item == option_more:
+            names += list_entries(c, tb, names[-1][0], PAGE_SIZE)
+            selected_item = ""
+        else:
+            # reload the pages already listed, entries may have changed
+            names = list_entries(c, tb, limit=max(len(names), PAGE_SIZE))
         # Create the list used in the main menu from the database
         items = []
-        for item in all_entry_names(c, tb):
+        for item in names:
             # store as a string, e.g.: "2018-01-02 12:34:56 (hint)"
             items.append(f"{item[0]} ({item[1]})")
+        # Offer the next page if this one is full
+        listing = search_query is None and calendar_query is None
+        if listing and names and len(names) % PAGE_SIZE == 0:
+            items.append(option_more)
         # Add main menu options to the list
-        items = [option_new_entry, option_new_entry_with_hint,
-                 option_exit, ""] + items
+        searching = [option_search, option_calendar]
+        if not listing:
+            searching.append(option_all)
+        items = [option_new_entry, option_new_entry_with_hint] + \
+            searching + [option_exit, ""] + items
         items += ["", "", option_delete_all]
         # Start main menu loop
-        loop("D3TA", items, c, tb, psw)
+        loop(title, items, c, tb, key)
         # If not a main menu option is selected, start another loop with
         #  selected_item and submenu_options
         if selected_item not in (
                 "", option_new_entry, option_new_entry_with_hint, option_exit,
-                option_delete_all):
-            loop(selected_item, submenu_options, c, tb, psw)
+                option_delete_all, option_more, option_search, option_all,
+                option_calendar):
+            loop(selected_item, submenu_options, c, tb, key)
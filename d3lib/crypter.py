@@ -22,9 +22,15 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import base64
-from Crypto.Cipher import AES
-from Crypto.Hash import SHA256
-from Crypto import Random
+import codecs
+import hashlib
+import hmac
+import io
+import lzma
+import os
+import struct
+import zlib
+from .backends import BLOCK_SIZE, backend
 
 __authors__ = "Korvin F. Ezüst"
 __copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
@@ -34,33 +40,456 @@ __email__ = "dev@korvin.eu"
 __status__ = "Production"
 
 
+# Storage formats
+# Entries used to be stored as base64 encoded text, they are stored as
+# BLOBs now with the format number in the first byte
+FORMAT_BASE64 = 1
+FORMAT_BLOB = 2
+# Same as FORMAT_BLOB with a codec number in the second byte,
+# the text is compressed with that codec before encryption
+FORMAT_COMPRESSED = 3
+# Same as FORMAT_COMPRESSED, but the text is split in segments that are
+# compressed and encrypted separately, each stored as a 4 byte length
+# followed by IV and encrypted segment
+FORMAT_CHUNKED = 4
+
+# Set in the format byte of entries that end with an HMAC-SHA256 tag
+# computed over everything before it, i.e. encrypt-then-MAC
+AUTHENTICATED = 0x80
+TAG_SIZE = 32
+
+# Entries longer than this many bytes are stored in FORMAT_CHUNKED
+SEGMENT_SIZE = 65536
+
+# Compression codecs, pairs of compress and decompress functions
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODECS = {
+    CODEC_NONE: (bytes, bytes),
+    CODEC_ZLIB: (zlib.compress, zlib.decompress),
+    CODEC_LZMA: (lzma.compress, lzma.decompress),
+}
+
+
+def derive_key(key):
+    """
+    Derives an AES key from a password by hashing it with SHA-256
+
+    :param key: password
+    :type key: str
+    :return: AES key
+    :rtype: bytes
+    """
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+def _mac_key(key):
+    """
+    Derives the key of the authentication tags from an AES key
+
+    :param key: AES key
+    :type key: bytes
+    :return: HMAC key
+    :rtype: bytes
+    """
+    return hmac.new(key, b"D3TA authentication", hashlib.sha256).digest()
+
+
+class SessionKey:
+    """
+    Keys derived from a password once, when a diary is unlocked, and used
+    for every entry read or written afterwards.
+    Every function taking a password also takes a SessionKey.
+    """
+
+    def __init__(self, password, authenticated=False):
+        # AES key
+        self.aes = derive_key(password)
+        # HMAC key of the authentication tags
+        self.mac = _mac_key(self.aes)
+        # Every entry of the diary has a tag, entries without one are
+        # rejected instead of being read unchecked
+        self.authenticated = authenticated
+
+
+def session_key(key):
+    """
+    Returns a session key, derived from 'key' if it is a password
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :return: session key
+    :rtype: SessionKey
+    """
+    if isinstance(key, SessionKey):
+        return key
+    return SessionKey(key)
+
+
+def _authentic(key, source):
+    """
+    Checks the authentication tag of an encrypted entry without
+    decrypting it
+
+    :param key: session key
+    :type key: SessionKey
+    :param source: encrypted entry, base64 text or BLOB
+    :type source: str|bytes-like object
+    :return: True|False, None if the entry has no tag and the diary isn't
+             authenticated
+    :rtype: bool
+    """
+    if isinstance(source, str) or not len(source) or \
+            not source[0] & AUTHENTICATED:
+        return False if key.authenticated else None
+    if len(source) <= TAG_SIZE:
+        return False
+    source = memoryview(source)
+    tag = hmac.new(key.mac, source[:-TAG_SIZE], hashlib.sha256).digest()
+    return hmac.compare_digest(tag, source[-TAG_SIZE:])
+
+
+def _authentic_stream(key, source):
+    """
+    Checks the authentication tag of an encrypted entry read from a
+    file-like object, without holding all of it in memory
+
+    :param key: session key
+    :type key: SessionKey
+    :param source: encrypted entry, positioned anywhere
+    :type source: file-like object
+    :return: True|False, and the position where the tag starts
+    :rtype: bool, int
+    """
+    source.seek(0, io.SEEK_END)
+    end = source.tell() - TAG_SIZE
+    source.seek(0)
+    mac = hmac.new(key.mac, digestmod=hashlib.sha256)
+    position = 0
+    while position < end:
+        data = source.read(min(SEGMENT_SIZE, end - position))
+        mac.update(data)
+        position += len(data)
+    return hmac.compare_digest(mac.digest(), source.read(TAG_SIZE)), end
+
+
+def _encrypted_size(size):
+    """
+    Returns the size of IV and encrypted data for 'size' bytes of input
+
+    :param size: number of bytes to be encrypted
+    :type size: int
+    :return: number of bytes
+    :rtype: int
+    """
+    return BLOCK_SIZE * (size // BLOCK_SIZE + 2)
+
+
+def _encrypt_into(key, iv, source, target):
+    """
+    Encrypts bytes with an already derived AES key into a buffer.
+    Only the last block is padded and copied, the rest of the data is
+    encrypted straight from 'source' into 'target'.
+
+    :param key: AES key
+    :type key: bytes
+    :param iv: initialization vector
+    :type iv: bytes
+    :param source: data to be encrypted
+    :type source: memoryview
+    :param target: buffer of _encrypted_size(len(source)) bytes, receives
+                   the IV followed by the encrypted data
+    :type target: memoryview
+    """
+    # Calculate padding
+    padding = BLOCK_SIZE - len(source) % BLOCK_SIZE
+    full = len(source) + padding - BLOCK_SIZE
+    last = bytes(source[full:]) + bytes([padding]) * padding
+    # Store the IV at the beginning and encrypt
+    target[:BLOCK_SIZE] = iv
+    backend().encrypt_into(key, iv, source[:full], last, target[BLOCK_SIZE:])
+
+
+def _encrypt(key, iv, source):
+    """
+    Encrypts bytes with an already derived AES key
+
+    :param key: AES key
+    :type key: bytes
+    :param iv: initialization vector
+    :type iv: bytes
+    :param source: data to be encrypted
+    :type source: bytes-like object
+    :return: IV followed by the encrypted data
+    :rtype: bytearray
+    """
+    source = memoryview(source)
+    target = bytearray(_encrypted_size(len(source)))
+    _encrypt_into(key, iv, source, memoryview(target))
+    return target
+
+
+def _decrypt(key, source):
+    """
+    Decrypts data with an already derived AES key
+
+    :param key: AES key
+    :type key: bytes
+    :param source: IV followed by the encrypted data
+    :type source: bytes-like object
+    :return: decrypted data
+    :rtype: memoryview
+    """
+    source = memoryview(source)
+    # Extract the IV from the beginning
+    iv = bytes(source[:BLOCK_SIZE])
+    # Decrypt
+    data = backend().decrypt(key, iv, source[BLOCK_SIZE:])
+    # Pick the padding value from the end
+    padding = data[-1] if data else 0
+    if not padding or data[-padding:] != bytes([padding]) * padding:
+        raise ValueError("Invalid padding...")
+    # Remove the padding without copying
+    return memoryview(data)[:-padding]
+
+
+def _encrypt_signed(key, iv, header, source):
+    """
+    Encrypts bytes with a session key into a single buffer holding
+    'header', IV, encrypted data and authentication tag
+
+    :param key: session key
+    :type key: SessionKey
+    :param iv: initialization vector
+    :type iv: bytes
+    :param header: format byte with AUTHENTICATED set, and codec byte
+    :type header: bytes
+    :param source: data to be encrypted
+    :type source: memoryview
+    :return: encrypted entry
+    :rtype: bytearray
+    """
+    target = bytearray(
+        len(header) + _encrypted_size(len(source)) + TAG_SIZE)
+    view = memoryview(target)
+    view[:len(header)] = header
+    _encrypt_into(key.aes, iv, source, view[len(header):-TAG_SIZE])
+    view[-TAG_SIZE:] = hmac.new(key.mac, view[:-TAG_SIZE],
+                                hashlib.sha256).digest()
+    return target
+
+
+def _encrypt_segments(key, chunks, codec, segment_size=SEGMENT_SIZE):
+    """
+    Encrypts bytes in FORMAT_CHUNKED with a session key,
+    holding at most one segment in memory
+
+    :param key: session key
+    :type key: SessionKey
+    :param chunks: data to be encrypted, in bytes-like pieces of any size
+    :type chunks: iterable
+    :param codec: CODEC_NONE, CODEC_ZLIB or CODEC_LZMA
+    :type codec: int
+    :param segment_size: number of bytes encrypted together
+    :type segment_size: int
+    :return: generator iterator of the header, the encrypted segments and
+             the authentication tag
+    :rtype: generator
+    """
+    compress = CODECS[codec][0]
+    mac = hmac.new(key.mac, digestmod=hashlib.sha256)
+
+    def segment(data):
+        if codec != CODEC_NONE:
+            data = memoryview(compress(data))
+        size = _encrypted_size(len(data))
+        target = bytearray(4 + size)
+        view = memoryview(target)
+        struct.pack_into(">I", target, 0, size)
+        _encrypt_into(key.aes, os.urandom(BLOCK_SIZE), data, view[4:])
+        mac.update(target)
+        return target
+
+    header = bytes([FORMAT_CHUNKED | AUTHENTICATED, codec])
+    mac.update(header)
+    yield header
+    buffer = bytearray()
+    for chunk in chunks:
+        chunk = memoryview(chunk)
+        if buffer:
+            # Fill up the segment left over from the previous piece
+            missing = segment_size - len(buffer)
+            buffer += chunk[:missing]
+            chunk = chunk[missing:]
+            if len(buffer) < segment_size:
+                continue
+            yield segment(memoryview(buffer))
+            buffer = bytearray()
+        # Whole segments are encrypted straight from the input
+        while len(chunk) >= segment_size:
+            yield segment(chunk[:segment_size])
+            chunk = chunk[segment_size:]
+        buffer += chunk
+    if buffer:
+        yield segment(memoryview(buffer))
+    yield mac.digest()
+
+
+def _decrypt_segments(key, source, end=None):
+    """
+    Decrypts an entry stored in FORMAT_CHUNKED with a session key,
+    one segment at a time
+
+    :param key: session key
+    :type key: SessionKey
+    :param source: encrypted entry after the format byte
+    :type source: file-like object
+    :param end: position where the segments end, if they are followed by
+                an authentication tag
+    :type end: int
+    :return: generator iterator of decrypted bytes
+    :rtype: generator
+    """
+    codec = source.read(1)[0]
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec}...")
+    decompress = CODECS[codec][1]
+    while end is None or source.tell() < end:
+        size = source.read(4)
+        if not size:
+            break
+        data = _decrypt(key.aes, source.read(struct.unpack(">I", size)[0]))
+        yield data if codec == CODEC_NONE else decompress(data)
+
+
+def _seal_bytes(key, iv, source, codec=CODEC_ZLIB):
+    """
+    Encrypts bytes with a session key in the current storage format.
+    The data is compressed with 'codec' first, unless that doesn't make it
+    shorter. Data longer than SEGMENT_SIZE is stored in FORMAT_CHUNKED.
+
+    :param key: session key
+    :type key: SessionKey
+    :param iv: initialization vector
+    :type iv: bytes
+    :param source: data to be encrypted
+    :type source: bytes-like object
+    :param codec: CODEC_NONE, CODEC_ZLIB or CODEC_LZMA
+    :type codec: int
+    :return: encrypted entry
+    :rtype: bytes|bytearray
+    """
+    source = memoryview(source)
+    if len(source) > SEGMENT_SIZE:
+        return b"".join(_encrypt_segments(key, [source], codec))
+    if codec != CODEC_NONE:
+        compressed = CODECS[codec][0](source)
+        if len(compressed) < len(source):
+            source = memoryview(compressed)
+        else:
+            # Short entries don't compress
+            codec = CODEC_NONE
+    return _encrypt_signed(
+        key, iv, bytes([FORMAT_COMPRESSED | AUTHENTICATED, codec]), source)
+
+
+def _unseal_bytes(key, source):
+    """
+    Decrypts an entry stored in any storage format with a session key
+
+    :param key: session key
+    :type key: SessionKey
+    :param source: encrypted entry, base64 text or BLOB
+    :type source: str|bytes-like object
+    :return: decrypted data
+    :rtype: memoryview
+    """
+    if key.authenticated and not _authentic(key, source):
+        raise ValueError("Invalid authentication tag...")
+    if isinstance(source, str):
+        return _decrypt(key.aes, base64.b64decode(source.encode("utf-8")))
+    source = memoryview(source)
+    fmt = source[0]
+    if fmt & AUTHENTICATED:
+        if not key.authenticated and not _authentic(key, source):
+            raise ValueError("Invalid authentication tag...")
+        # Remove the format flag and the tag
+        fmt &= ~AUTHENTICATED
+        source = source[:-TAG_SIZE]
+    if fmt == FORMAT_BLOB:
+        return _decrypt(key.aes, source[1:])
+    if fmt == FORMAT_COMPRESSED:
+        codec = source[1]
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec}...")
+        data = _decrypt(key.aes, source[2:])
+        return data if codec == CODEC_NONE else \
+            memoryview(CODECS[codec][1](data))
+    if fmt == FORMAT_CHUNKED:
+        return memoryview(b"".join(
+            _decrypt_segments(key, io.BytesIO(source[1:]))))
+    raise ValueError(f"Unknown storage format {fmt}...")
+
+
+def _seal(key, iv, source, fmt, codec=CODEC_ZLIB):
+    """
+    Encrypts a string with a session key in storage format 'fmt'.
+    With FORMAT_COMPRESSED it is the same as _seal_bytes().
+    Every format except FORMAT_BASE64 gets an authentication tag.
+
+    :param key: session key
+    :type key: SessionKey
+    :param iv: initialization vector
+    :type iv: bytes
+    :param source: text to be encrypted
+    :type source: str
+    :param fmt: FORMAT_BASE64, FORMAT_BLOB or FORMAT_COMPRESSED
+    :type fmt: int
+    :param codec: CODEC_NONE, CODEC_ZLIB or CODEC_LZMA
+    :type codec: int
+    :return: encrypted entry
+    :rtype: str|bytes-like object
+    """
+    source = source.encode("utf-8")
+    if fmt == FORMAT_BASE64:
+        data = _encrypt(key.aes, iv, source)
+        return base64.b64encode(data).decode("utf-8")
+    if fmt == FORMAT_BLOB:
+        return _encrypt_signed(key, iv, bytes([FORMAT_BLOB | AUTHENTICATED]),
+                               memoryview(source))
+    return _seal_bytes(key, iv, source, codec)
+
+
+def _unseal(key, source):
+    """
+    Decrypts an entry stored in any storage format with a session key
+
+    :param key: session key
+    :type key: SessionKey
+    :param source: encrypted entry, base64 text or BLOB
+    :type source: str|bytes-like object
+    :return: decrypted text
+    :rtype: str
+    """
+    return str(_unseal_bytes(key, source), "utf-8")
+
+
 def encrypt(key, source):
     """
     Encrypts a string using AES encryption
     and returns it encoded in base64 as a string
 
-    :param key: password
-    :type key: str
+    :param key: password or session key
+    :type key: str|SessionKey
     :param source: text to be encrypted
     :type source: str
     :return: encrypted text encoded in base64
     :rtype: str
     """
-    # Encode key and source to bytes
-    key = key.encode("utf-8")
-    source = source.encode("utf-8")
-    # Use SHA-256 over the key to get an AES key
-    key = SHA256.new(key).digest()
     # Generate IV
-    iv = Random.new().read(AES.block_size)
-    cip = AES.new(key, AES.MODE_CBC, iv)
-    # Calculate padding
-    padding = AES.block_size - len(source) % AES.block_size
-    source += bytes([padding]) * padding
-    # Store the IV at the beginning and encrypt
-    data = iv + cip.encrypt(source)
-    # Decode to string
-    return base64.b64encode(data).decode("utf-8")
+    iv = os.urandom(BLOCK_SIZE)
+    return _seal(session_key(key), iv, source, FORMAT_BASE64)
 
 
 def decrypt(key, source):
@@ -68,29 +497,247 @@ def decrypt(key, source):
     Decrypts a string that was encoded in base64
     and encrypted using AES encryption
 
-    :param key: password
-    :type key: str
+    :param key: password or session key
+    :type key: str|SessionKey
     :param source: encrypted text in base64
     :type source: str
     :return: decrypted text
     :rtype: str
     """
-    # Encode key and source to bytes
-    key = key.encode("utf-8")
-    source = base64.b64decode(source.encode("utf-8"))
-    # Use SHA-256 over the key to get an AES key
-    key = SHA256.new(key).digest()
-    # Extract the IV from the beginning
-    iv = source[:AES.block_size]
-    cip = AES.new(key, AES.MODE_CBC, iv)
-    # Decrypt
-    data = cip.decrypt(source[AES.block_size:])
-    # Pick the padding value from the end
-    padding = data[-1]
-    if data[-padding:] != bytes([padding]) * padding:
-        raise ValueError("Invalid padding...")
-    # Remove the padding, decode to string
-    return data[:-padding].decode("utf-8")
+    return _unseal(session_key(key), source)
+
+
+def encrypt_entry(key, source, codec=CODEC_ZLIB):
+    """
+    Compresses a string and encrypts it using AES encryption,
+    then returns it in the current storage format as bytes
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param source: text to be encrypted
+    :type source: str
+    :param codec: CODEC_NONE, CODEC_ZLIB or CODEC_LZMA
+    :type codec: int
+    :return: format number, codec number, IV and encrypted text
+    :rtype: bytes
+    """
+    iv = os.urandom(BLOCK_SIZE)
+    return _seal(session_key(key), iv, source, FORMAT_COMPRESSED, codec)
+
+
+def decrypt_entry(key, source):
+    """
+    Decrypts an entry stored in any storage format
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param source: encrypted entry, base64 text or BLOB
+    :type source: str|bytes
+    :return: decrypted text
+    :rtype: str
+    """
+    return _unseal(session_key(key), source)
+
+
+def encrypt_bytes(key, source, codec=CODEC_ZLIB):
+    """
+    Compresses bytes and encrypts them using AES encryption,
+    then returns them in the current storage format.
+    The entry is built in a single preallocated buffer, large data is
+    encrypted straight from 'source' without copying it first.
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param source: data to be encrypted, e.g. UTF-8 encoded text
+    :type source: bytes-like object
+    :param codec: CODEC_NONE, CODEC_ZLIB or CODEC_LZMA
+    :type codec: int
+    :return: format number, codec number, IV and encrypted data
+    :rtype: bytes-like object
+    """
+    iv = os.urandom(BLOCK_SIZE)
+    return _seal_bytes(session_key(key), iv, source, codec)
+
+
+def decrypt_bytes(key, source):
+    """
+    Decrypts an entry stored in any storage format to bytes.
+    The result is a view of the decrypted buffer, use bytes() on it to get
+    a copy or str(result, "utf-8") to decode it.
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param source: encrypted entry, base64 text or BLOB
+    :type source: str|bytes-like object
+    :return: decrypted data
+    :rtype: memoryview
+    """
+    return _unseal_bytes(session_key(key), source)
+
+
+def blob_from_base64(source):
+    """
+    Converts an entry stored as base64 text to a BLOB without decrypting it
+
+    :param source: encrypted text in base64
+    :type source: str
+    :return: format number, IV and encrypted text
+    :rtype: bytes
+    """
+    return bytes([FORMAT_BLOB]) + base64.b64decode(source.encode("utf-8"))
+
+
+def sign_entry(key, source):
+    """
+    Adds an authentication tag to an entry stored as a BLOB without one,
+    without decrypting it
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param source: encrypted entry without a tag
+    :type source: bytes-like object
+    :return: encrypted entry with a tag
+    :rtype: bytes
+    """
+    key = session_key(key)
+    signed = bytes([source[0] | AUTHENTICATED]) + bytes(source[1:])
+    return signed + hmac.new(key.mac, signed, hashlib.sha256).digest()
+
+
+def encrypt_many(key, sources, fmt=FORMAT_BASE64, codec=CODEC_ZLIB):
+    """
+    Encrypts strings one by one, deriving the keys only once.
+    Output is the same as calling encrypt() on each string, or
+    encrypt_entry() if 'fmt' is FORMAT_COMPRESSED.
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param sources: texts to be encrypted
+    :type sources: iterable
+    :param fmt: FORMAT_BASE64, FORMAT_BLOB or FORMAT_COMPRESSED
+    :type fmt: int
+    :param codec: codec used with FORMAT_COMPRESSED
+    :type codec: int
+    :return: generator iterator of encrypted texts
+    :rtype: generator
+    """
+    key = session_key(key)
+    for source in sources:
+        yield _seal(key, os.urandom(BLOCK_SIZE), source, fmt, codec)
+
+
+def decrypt_many(key, sources):
+    """
+    Decrypts entries one by one, deriving the keys only once.
+    Output is the same as calling decrypt_entry() on each entry.
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param sources: encrypted entries, base64 texts or BLOBs
+    :type sources: iterable
+    :return: generator iterator of decrypted texts
+    :rtype: generator
+    """
+    key = session_key(key)
+    for source in sources:
+        yield _unseal(key, source)
+
+
+def verify_entry(key, source):
+    """
+    Checks the authentication tag of an encrypted entry without
+    decrypting it
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param source: encrypted entry, base64 text or BLOB
+    :type source: str|bytes
+    :return: True|False, None if the entry is stored in a format without
+             a tag and the diary isn't authenticated, see SessionKey
+    :rtype: bool
+    """
+    return _authentic(session_key(key), source)
+
+
+def verify_many(key, sources):
+    """
+    Checks the authentication tags of encrypted entries one by one,
+    deriving the keys only once
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param sources: encrypted entries, base64 texts or BLOBs
+    :type sources: iterable
+    :return: generator iterator of True|False|None, see verify_entry()
+    :rtype: generator
+    """
+    key = session_key(key)
+    for source in sources:
+        yield _authentic(key, source)
+
+
+def encrypt_stream(key, chunks, codec=CODEC_ZLIB, segment_size=SEGMENT_SIZE):
+    """
+    Encrypts a text given in pieces in FORMAT_CHUNKED, without holding more
+    than one segment of it in memory.
+    Joining the returned pieces gives the encrypted entry.
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param chunks: text to be encrypted, in pieces of any size
+    :type chunks: iterable
+    :param codec: CODEC_NONE, CODEC_ZLIB or CODEC_LZMA
+    :type codec: int
+    :param segment_size: number of bytes encrypted together
+    :type segment_size: int
+    :return: generator iterator of encrypted bytes
+    :rtype: generator
+    """
+    return _encrypt_segments(session_key(key),
+                             (chunk.encode("utf-8") for chunk in chunks),
+                             codec, segment_size)
+
+
+def decrypt_stream(key, source):
+    """
+    Decrypts an entry one segment at a time.
+    Entries stored in other formats than FORMAT_CHUNKED are decrypted at
+    once and returned as a single piece.
+
+    :param key: password or session key
+    :type key: str|SessionKey
+    :param source: encrypted entry, base64 text, BLOB or a file-like object
+                   reading a BLOB, e.g. sqlite3.Blob
+    :type source: str|bytes|file-like object
+    :return: generator iterator of decrypted text
+    :rtype: generator
+    """
+    key = session_key(key)
+    if isinstance(source, str):
+        yield _unseal(key, source)
+        return
+    if not hasattr(source, "read"):
+        source = io.BytesIO(source)
+    fmt = source.read(1)
+    if not fmt:
+        raise ValueError("Empty entry...")
+    if fmt[0] & ~AUTHENTICATED != FORMAT_CHUNKED:
+        yield _unseal(key, fmt + source.read())
+        return
+    end = None
+    if key.authenticated and not fmt[0] & AUTHENTICATED:
+        raise ValueError("Invalid authentication tag...")
+    if fmt[0] & AUTHENTICATED:
+        # Check the whole entry before decrypting any of it
+        valid, end = _authentic_stream(key, source)
+        if not valid:
+            raise ValueError("Invalid authentication tag...")
+        source.seek(1)
+    # A character may be split between two segments
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for data in _decrypt_segments(key, source, end):
+        yield decoder.decode(data)
+    decoder.decode(b"", final=True)
 
 
 if __name__ == "__main__":
@@ -26,7 +26,43 @@ import os
 import sqlite3
 import sys
 from contextlib import contextmanager
-from .crypter import encrypt, decrypt
+from datetime import datetime, timedelta
+from .crypter import (
+    FORMAT_BASE64,
+    FORMAT_BLOB,
+    SessionKey,
+    blob_from_base64,
+    decrypt_entry,
+    decrypt_stream,
+    encrypt_entry,
+    sign_entry)
+from .cache import DEFAULT_BUDGET, FINGERPRINT_SIZE, EntryCache
+from .parallel import reencrypt_rows, verify_rows
+from .search import (
+    clear_index,
+    create_index,
+    index_entry,
+    rewrap_secret,
+    search_entries,
+    unindex_entry,
+    unindexed)
+from .revisions import (
+    clear_revisions,
+    delete_revisions,
+    has_revisions,
+    record_revision,
+    revision_list,
+    revision_text,
+    revisions_table)
+from .stats import (
+    clear_stats,
+    count_entry,
+    create_stats,
+    longest_entries,
+    monthly_totals,
+    totals,
+    uncount_entry,
+    uncounted)
 
 __author__ = "Korvin F. Ezüst"
 __copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
@@ -35,33 +71,264 @@ __version__ = "1.0"
 __email__ = "dev@korvin.eu"
 __status__ = "Production"
 
+# Number of entry names fetched at once when listing a diary
+PAGE_SIZE = 1000
+# Number of database pages copied at once when backing up, other
+# connections may write between the steps
+BACKUP_PAGES = 1024
+
+# Connection settings, see https://www.sqlite.org/pragma.html
+# cache_size is in KiB when negative, mmap_size is in bytes
+PROFILES = {
+    # SQLite's defaults, every commit is on the disk when it returns
+    "safe": {
+        "journal_mode": "delete",
+        "synchronous": "full",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "default",
+    },
+    # Write-ahead log synced at checkpoints, a crash may lose the last
+    # commits but doesn't corrupt the database
+    "fast": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -65536,
+        "mmap_size": 256 * 2 ** 20,
+        "temp_store": "memory",
+    },
+    # Write-ahead log and a big cache for re-encrypting or importing,
+    # bulk_profile() syncs the whole change when it's committed
+    "bulk": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -262144,
+        "mmap_size": 2 ** 30,
+        "temp_store": "memory",
+    },
+}
+DEFAULT_PROFILE = "safe"
+# Values returned by PRAGMA synchronous and PRAGMA temp_store
+SYNCHRONOUS = ("off", "normal", "full", "extra")
+TEMP_STORE = ("default", "file", "memory")
+
+# Column ts holds the seconds from EPOCH to the date as written, without
+# time zones, so days are always DAY seconds long
+EPOCH = datetime(1970, 1, 1)
+DAY = 86400
+
+
+def apply_settings(c, settings):
+    """
+    Sets the connection settings in 'settings', a profile or what
+    current_settings() returned.
+    The journal mode stays as it is if another connection keeps the
+    database open.
+
+    :param c: sqlite3 Cursor instance, not in a transaction
+    :type c: sqlite3.Cursor
+    :param settings: values by PRAGMA name
+    :type settings: dict
+    """
+    for name, value in settings.items():
+        try:
+            c.execute(f"PRAGMA {name} = {value}")
+            c.fetchall()
+        except sqlite3.OperationalError:
+            if name != "journal_mode":
+                raise
+
+
+def apply_profile(c, profile=DEFAULT_PROFILE):
+    """
+    Sets the connection settings of a profile in PROFILES
+
+    :param c: sqlite3 Cursor instance, not in a transaction
+    :type c: sqlite3.Cursor
+    :param profile: "safe", "fast" or "bulk"
+    :type profile: str
+    """
+    apply_settings(c, PROFILES[profile])
+
+
+def current_settings(c):
+    """
+    Returns the connection settings in effect, in the format of PROFILES
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :return: values by PRAGMA name
+    :rtype: dict
+    """
+    settings = {}
+    for name in PROFILES[DEFAULT_PROFILE]:
+        c.execute(f"PRAGMA {name}")
+        settings[name] = c.fetchone()[0]
+    settings["synchronous"] = SYNCHRONOUS[settings["synchronous"]]
+    settings["temp_store"] = TEMP_STORE[settings["temp_store"]]
+    return settings
+
+
+def diagnostics(c):
+    """
+    Returns the profile and the connection settings in effect, the SQLite
+    version and the size of the database
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :return: values by name, profile is None if the settings don't match
+             any in PROFILES
+    :rtype: dict
+    """
+    settings = current_settings(c)
+    profile = None
+    for name, values in PROFILES.items():
+        if values == settings:
+            profile = name
+    info = {"profile": profile, "sqlite_version": sqlite3.sqlite_version}
+    info.update(settings)
+    for name in ("page_size", "page_count", "freelist_count"):
+        c.execute(f"PRAGMA {name}")
+        info[name] = c.fetchone()[0]
+    return info
+
+
+@contextmanager
+def bulk_profile(c, profile="bulk"):
+    """
+    Runs the block in a transaction of its own with the settings of
+    'profile', except for the journal mode, then restores the previous
+    settings.
+    Pending changes are committed first, as the safety level can't change
+    inside a transaction. The block is committed at the end, or when the
+    program exits inside it, and rolled back if an exception is raised.
+    A write-ahead log is checkpointed after the commit, so the change is on
+    the disk when the block ends.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param profile: "safe", "fast" or "bulk"
+    :type profile: str
+    :return: generator iterator
+    :rtype: sqlite3.Cursor
+    """
+    conn = c.connection
+    conn.commit()
+    before = current_settings(c)
+    del before["journal_mode"]
+    settings = dict(PROFILES[profile])
+    del settings["journal_mode"]
+    apply_settings(c, settings)
+    try:
+        yield c
+        conn.commit()
+        _sync(c)
+    except SystemExit:
+        conn.commit()
+        _sync(c)
+        raise
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        apply_settings(c, before)
+
+
+def _sync(c):
+    """
+    Writes every commit to the disk, with synchronous=normal a commit in
+    a write-ahead log is only synced at the next checkpoint
+
+    :param c: sqlite3 Cursor instance, not in a transaction
+    :type c: sqlite3.Cursor
+    """
+    c.execute("PRAGMA journal_mode")
+    if c.fetchone()[0] == "wal":
+        c.execute("PRAGMA wal_checkpoint(FULL)")
+        c.fetchall()
+
 
 @contextmanager
-def open_database(db):
+def open_database(db, profile=DEFAULT_PROFILE):
     """
-    Open database as a context manager
+    Open database as a context manager.
+    Changes are committed at the end, or when the program exits inside the
+    block, and rolled back if an exception is raised.
 
     :param db: filename
     :type db: str
+    :param profile: connection settings, "safe", "fast" or "bulk"
+    :type profile: str
     :return: generator iterator
     :rtype: sqlite3.Cursor
     """
     conn = sqlite3.connect(db)
     c = conn.cursor()
     c.fetchone()
-    yield c
-    conn.commit()
-    c.close()
-    conn.close()
+    try:
+        apply_profile(c, profile)
+        yield c
+        conn.commit()
+    except SystemExit:
+        # Exiting with a message is a normal end of the program
+        conn.commit()
+        raise
+    finally:
+        # Anything not committed is rolled back
+        c.close()
+        conn.close()
+
+
+def backup_database(db, target=None, pages=BACKUP_PAGES, progress=None):
+    """
+    Copies a database with SQLite's backup API, including changes still in
+    the write-ahead log, then checks the integrity of the copy.
+    The copy is a consistent snapshot even if another connection writes
+    during the backup, the backup restarts in that case.
+
+    :param db: filename
+    :type db: str
+    :param target: filename of the copy, defaults to 'db' + ".bak"
+    :type target: str
+    :param pages: number of pages copied at once
+    :type pages: int
+    :param progress: called with the number of pages copied so far and the
+                     number of all pages after every step
+    :type progress: function
+    :return: True if the copy passed PRAGMA integrity_check, False if not
+    :rtype: bool
+    """
+    if target is None:
+        target = db + ".bak"
+
+    def step(status, remaining, total):
+        progress(total - remaining, total)
+
+    source = sqlite3.connect(db)
+    try:
+        copy = sqlite3.connect(target)
+        try:
+            source.backup(copy, pages=pages,
+                          progress=None if progress is None else step)
+            c = copy.execute("PRAGMA integrity_check")
+            result = c.fetchall()
+        finally:
+            copy.close()
+    finally:
+        source.close()
+    return result == [("ok",)]
 
 
 def create_main_table(c, tb):
     """
     Create new table with name as value of 'tb'.
-    In that table, create columns date, hint and entry:
+    In that table, create columns date, hint, entry and ts:
     - date is datetime type (i.e. with format 2018-01-02 12:34:56)
     - hint is tinytext type (max 255 characters)
-    - entry is longtext type (max 4 294 967 295 characters).
+    - entry is blob type (format number, IV and encrypted text)
+    - ts is integer type (the date in seconds, see timestamp()).
+    Dates are unique, see create_date_index(), and ts is indexed, see
+    create_time_index().
 
     :param c: sqlite3 Cursor instance
     :type c: sqlite3.Cursor
@@ -69,7 +336,232 @@ def create_main_table(c, tb):
     :type tb: str
     """
     c.execute(f"CREATE TABLE {tb} (date datetime, hint tinytext, "
-              f"entry longtext)")
+              f"entry blob, ts integer)")
+    create_date_index(c, tb)
+    create_time_index(c, tb)
+
+
+def insert_statement(tb):
+    """
+    Returns the statement inserting a date, a hint and an encrypted entry
+    into table 'tb', column ts is computed from the date by SQLite
+
+    :param tb: table
+    :type tb: str
+    :return: SQL statement with three parameters
+    :rtype: str
+    """
+    return (f"INSERT INTO {tb} (date, hint, entry, ts) "
+            f"VALUES (?1, ?2, ?3, CAST(strftime('%s', ?1) AS INTEGER))")
+
+
+def create_date_index(c, tb):
+    """
+    Create a unique index on column date of table 'tb', so entries are
+    looked up by date without reading the whole table.
+    Databases already holding two entries with the same date get an index
+    that isn't unique instead.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    """
+    try:
+        c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {tb}_date "
+                  f"ON {tb} (date)")
+    except sqlite3.IntegrityError:
+        c.execute(f"CREATE INDEX IF NOT EXISTS {tb}_date ON {tb} (date)")
+
+
+def create_time_index(c, tb):
+    """
+    Add column ts to table 'tb' if it doesn't have it, fill it in for the
+    rows written without it, and index it, so dates are looked up by range
+    without reading the whole table.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    """
+    c.execute(f"PRAGMA table_info({tb})")
+    if "ts" not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE {tb} ADD COLUMN ts integer")
+    c.execute(f"UPDATE {tb} SET ts = CAST(strftime('%s', date) AS INTEGER) "
+              f"WHERE ts IS NULL")
+    c.execute(f"CREATE INDEX IF NOT EXISTS {tb}_ts ON {tb} (ts)")
+
+
+def timestamp(dt):
+    """
+    Returns the seconds from 1970-01-01 00:00:00 to a date as written,
+    without time zones, the same as SQLite's strftime('%s', dt)
+
+    :param dt: date, e.g. 2018-01-02 or 2018-01-02 12:34:56
+    :type dt: str|datetime.datetime
+    :return: seconds
+    :rtype: int
+    """
+    if isinstance(dt, str):
+        dt = datetime.fromisoformat(dt)
+    return (dt - EPOCH) // timedelta(seconds=1)
+
+
+def create_meta_table(c, fmt=FORMAT_BLOB):
+    """
+    Create table meta with columns key and value, storing the storage
+    format of the entries under key 'format'
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param fmt: storage format
+    :type fmt: int
+    """
+    c.execute("CREATE TABLE meta (key text PRIMARY KEY, value text)")
+    c.execute("INSERT INTO meta VALUES ('format', ?)", (str(fmt),))
+
+
+def storage_format(c):
+    """
+    Returns the storage format of the entries.
+    Databases without table meta store base64 text.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :return: FORMAT_BASE64 or FORMAT_BLOB
+    :rtype: int
+    """
+    c.execute("SELECT name FROM sqlite_master "
+              "WHERE type = 'table' AND name = 'meta'")
+    if c.fetchone() is None:
+        return FORMAT_BASE64
+    c.execute("SELECT value FROM meta WHERE key = 'format'")
+    return int(c.fetchone()[0])
+
+
+def migrate_to_blobs(c, tb, batch=500):
+    """
+    Converts entries stored as base64 text to BLOBs in place.
+    Entries aren't decrypted, so no password is needed, and only 'batch'
+    rows are held in memory at once.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param batch: number of rows converted at once
+    :type batch: int
+    :return: number of converted entries
+    :rtype: int
+    """
+    converted = 0
+    last = 0
+    while True:
+        c.execute(f"SELECT rowid, entry FROM {tb} "
+                  f"WHERE rowid > ? AND typeof(entry) = 'text' "
+                  f"ORDER BY rowid LIMIT ?", (last, batch))
+        rows = c.fetchall()
+        if not rows:
+            break
+        last = rows[-1][0]
+        c.executemany(f"UPDATE {tb} SET entry = ? WHERE rowid = ?",
+                      [(blob_from_base64(ent), rowid) for rowid, ent in rows])
+        converted += len(rows)
+    # Record the new format
+    if storage_format(c) == FORMAT_BASE64:
+        create_meta_table(c)
+    return converted
+
+
+def authenticated(c):
+    """
+    Returns True if every entry has an authentication tag, recorded in
+    table meta under key 'authenticated'
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :return: True|False
+    :rtype: bool
+    """
+    if storage_format(c) < FORMAT_BLOB:
+        return False
+    c.execute("SELECT value FROM meta WHERE key = 'authenticated'")
+    return c.fetchone() is not None
+
+
+def set_authenticated(c):
+    """
+    Records that every entry has an authentication tag, from now on
+    entries without one are rejected
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    """
+    c.execute("INSERT OR REPLACE INTO meta VALUES ('authenticated', '1')")
+
+
+def sign_entries(c, tb, key, batch=500):
+    """
+    Adds an authentication tag to every entry and revision stored without
+    one, and records that the diary is authenticated.
+    Entries aren't decrypted, only 'batch' rows are held in memory at once.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param batch: number of rows signed at once
+    :type batch: int
+    :return: number of signed entries
+    :rtype: int
+    """
+    tables = [tb]
+    if has_revisions(c, tb):
+        tables.append(revisions_table(tb))
+    signed = 0
+    for name in tables:
+        last = 0
+        while True:
+            c.execute(f"SELECT rowid, entry FROM {name} "
+                      f"WHERE rowid > ? AND typeof(entry) = 'blob' "
+                      f"AND substr(entry, 1, 1) < x'80' "
+                      f"ORDER BY rowid LIMIT ?", (last, batch))
+            rows = c.fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            c.executemany(f"UPDATE {name} SET entry = ? WHERE rowid = ?",
+                          [(sign_entry(key, ent), rowid)
+                           for rowid, ent in rows])
+            signed += len(rows)
+    set_authenticated(c)
+    return signed
+
+
+def upgrade_database(c, tb, key=None):
+    """
+    Brings a database created by an earlier version up to date, called
+    every time a database is opened.
+    With a session key, entries stored without an authentication tag get
+    one and the key rejects untagged entries from then on.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key, see unlock()
+    :type key: SessionKey
+    """
+    if storage_format(c) < FORMAT_BLOB:
+        migrate_to_blobs(c, tb)
+    create_date_index(c, tb)
+    create_time_index(c, tb)
+    if key is not None and not authenticated(c):
+        sign_entries(c, tb, key)
+        key.authenticated = True
 
 
 def create_database(db, tb, psw):
@@ -95,7 +587,8 @@ def create_database(db, tb, psw):
         # Store salted hash generated from password in hash
         hashed = bcrypt.hashpw(psw.encode("utf-8"), bcrypt.gensalt())
         hashed = hashed.decode("utf-8")
-        c.execute(f"INSERT INTO hash VALUES (\"{hashed}\")")
+        c.execute("INSERT INTO hash VALUES (?)", (hashed,))
+        create_meta_table(c)
         conn.commit()
         c.close()
         conn.close()
@@ -103,7 +596,7 @@ def create_database(db, tb, psw):
         sys.exit(f"'{db}' exists.")
 
 
-def add_entry(c, tb, dt, psw, ent, ht=""):
+def add_entry(c, tb, dt, key, ent, ht=""):
     """
     Adds a new row in table 'tb'
 
@@ -113,25 +606,72 @@ def add_entry(c, tb, dt, psw, ent, ht=""):
     :type tb: str
     :param dt: datetime
     :type dt: str
-    :param psw: password
-    :type psw: psw
+    :param key: session key or password
+    :type key: SessionKey|str
     :param ent: entry
     :type ent: str
     :param ht: hint
     :type ht: str
     """
-    # Check if row with 'datetime' exists
-    c.execute(f"SELECT entry FROM {tb} WHERE date = '{dt}'")
+    # Check if row with 'datetime' exists, only the index is read
+    c.execute(f"SELECT 1 FROM {tb} WHERE date = ?", (dt,))
     if c.fetchone() is None:
-        # Encrypt entry
-        ent = encrypt(psw, ent)
         # Store datetime, hint and encrypted entry
-        c.execute(f"INSERT INTO {tb} VALUES ('{dt}', '{ht}', '{ent}')")
+        c.execute(insert_statement(tb), (dt, ht, encrypt_entry(key, ent)))
+        index_entry(c, tb, key, dt, ent)
+        count_entry(c, tb, dt, ent)
     else:
         sys.exit(f"Entry with {dt} already exists.")
 
 
-def single_entry(c, tb, dt, psw):
+def update_entry(c, tb, dt, key, ent, ht=None):
+    """
+    Replaces the text, and optionally the hint, of an entry in table 'tb'
+    in place, and records the new text as a revision, see
+    d3lib.revisions.record_revision().
+    Nothing is written if neither of them changed, so saving an unchanged
+    entry costs a lookup and a decryption only.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param ent: entry
+    :type ent: str
+    :param ht: hint, None keeps the stored one
+    :type ht: str
+    :return: True if the entry was written, False if it didn't change
+    :rtype: bool
+    """
+    c.execute(f"SELECT hint, entry FROM {tb} WHERE date = ?", (dt,))
+    row = c.fetchone()
+    if row is None:
+        sys.exit(f"Entry with {dt} doesn't exist.")
+    stored_ht, stored = row
+    if ht is None:
+        ht = stored_ht
+    # A new ciphertext never equals the stored one, compare the texts
+    try:
+        old = decrypt_entry(key, stored)
+    except ValueError:
+        # Overwrite a corrupt entry
+        old = None
+    if ht == stored_ht and old == ent:
+        return False
+    c.execute(f"UPDATE {tb} SET hint = ?, entry = ? WHERE date = ?",
+              (ht, encrypt_entry(key, ent), dt))
+    index_entry(c, tb, key, dt, ent)
+    count_entry(c, tb, dt, ent)
+    if old != ent:
+        record_revision(c, tb, key, dt, old, ent)
+    return True
+
+
+def single_entry(c, tb, dt, key):
     """
     Returns a decrypted entry from table 'tb'
 
@@ -141,14 +681,297 @@ def single_entry(c, tb, dt, psw):
     :type tb: str
     :param dt: datetime
     :type dt: str
-    :param psw: password
-    :type psw: str
+    :param key: session key or password
+    :type key: SessionKey|str
     :return: decrypted entry
     :rtype: str
     """
     # Get the entry where its datetime matches 'dt'
-    c.execute(f"SELECT entry FROM {tb} WHERE date = '{dt}'")
-    return decrypt(psw, c.fetchone()[0])
+    c.execute(f"SELECT entry FROM {tb} WHERE date = ?", (dt,))
+    return decrypt_entry(key, c.fetchone()[0])
+
+
+def entry_fingerprint(c, tb, dt):
+    """
+    Returns the last FINGERPRINT_SIZE bytes of an encrypted entry from
+    table 'tb', they change every time the entry is written.
+    Only the end of a BLOB is read where incremental BLOB I/O is available.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    :return: end of the entry, None if there's no entry at 'dt'
+    :rtype: bytes|str
+    """
+    c.execute(f"SELECT rowid, typeof(entry) FROM {tb} WHERE date = ?", (dt,))
+    row = c.fetchone()
+    if row is None:
+        return None
+    rowid, kind = row
+    conn = c.connection
+    if kind == "blob" and hasattr(conn, "blobopen"):
+        with conn.blobopen(tb, "entry", rowid, readonly=True) as blob:
+            blob.seek(max(len(blob) - FINGERPRINT_SIZE, 0))
+            return blob.read()
+    c.execute(f"SELECT substr(entry, -{FINGERPRINT_SIZE}) FROM {tb} "
+              f"WHERE rowid = ?", (rowid,))
+    return c.fetchone()[0]
+
+
+def entry_stream(c, tb, dt, key):
+    """
+    Returns a decrypted entry from table 'tb' in pieces, so the beginning
+    of a long entry can be shown before the rest is read and decrypted
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :return: generator iterator of decrypted text
+    :rtype: generator
+    """
+    c.execute(f"SELECT rowid, typeof(entry) FROM {tb} WHERE date = ?", (dt,))
+    rowid, kind = c.fetchone()
+    conn = c.connection
+    # Incremental BLOB I/O is available since Python 3.11
+    if kind == "blob" and hasattr(conn, "blobopen"):
+        with conn.blobopen(tb, "entry", rowid, readonly=True) as blob:
+            yield from decrypt_stream(key, blob)
+    else:
+        yield single_entry(c, tb, dt, key)
+
+
+def list_entries(c, tb, after=None, limit=None):
+    """
+    Returns the names of entries in table 'tb', newest first, without
+    reading the entries themselves.
+    The next page starts after the date of the last name of the previous
+    one, found through the date index however deep the page is.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param after: datetime, only older entries are listed
+    :type after: str
+    :param limit: maximum number of names, None lists every one
+    :type limit: int
+    :return: list of tuples containing a datetime and a hint
+    :rtype: list
+    """
+    if limit is None:
+        limit = -1
+    if after is None:
+        c.execute(f"SELECT date, hint FROM {tb} ORDER BY date DESC LIMIT ?",
+                  (limit,))
+    else:
+        c.execute(f"SELECT date, hint FROM {tb} WHERE date < ? "
+                  f"ORDER BY date DESC LIMIT ?", (after, limit))
+    return c.fetchall()
+
+
+def entry_names(c, tb, page=PAGE_SIZE):
+    """
+    Returns the names of all entries in table 'tb', newest first, one page
+    at a time, so the first page can be shown before the rest is read
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param page: number of names in a page
+    :type page: int
+    :return: generator iterator of lists of tuples containing a datetime
+             and a hint
+    :rtype: generator
+    """
+    names = list_entries(c, tb, limit=page)
+    while names:
+        yield names
+        if len(names) < page:
+            return
+        names = list_entries(c, tb, names[-1][0], page)
+
+
+def entries_between(c, tb, start, end):
+    """
+    Returns the names of entries from 'start' up to, but not including,
+    'end', newest first.
+    Only the index of column ts and the dates and hints of the entries
+    found are read.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param start: first date, e.g. 2018-01-02 or 2018-01-02 12:34:56
+    :type start: str|datetime.datetime
+    :param end: date after the last one
+    :type end: str|datetime.datetime
+    :return: list of tuples containing a datetime and a hint
+    :rtype: list
+    """
+    c.execute(f"SELECT date, hint FROM {tb} WHERE ts >= ? AND ts < ? "
+              f"ORDER BY ts DESC", (timestamp(start), timestamp(end)))
+    return c.fetchall()
+
+
+def next_month(year, month):
+    """
+    Returns the first day of the month after 'month'
+
+    :param year: year
+    :type year: int
+    :param month: month, 1 to 12
+    :type month: int
+    :return: first day of the next month
+    :rtype: datetime.datetime
+    """
+    if month == 12:
+        return datetime(year + 1, 1, 1)
+    return datetime(year, month + 1, 1)
+
+
+def entries_in_month(c, tb, year, month):
+    """
+    Returns the names of the entries of a month, newest first
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param year: year
+    :type year: int
+    :param month: month, 1 to 12
+    :type month: int
+    :return: list of tuples containing a datetime and a hint
+    :rtype: list
+    """
+    return entries_between(c, tb, datetime(year, month, 1),
+                           next_month(year, month))
+
+
+def entries_in_year(c, tb, year):
+    """
+    Returns the names of the entries of a year, newest first
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param year: year
+    :type year: int
+    :return: list of tuples containing a datetime and a hint
+    :rtype: list
+    """
+    return entries_between(c, tb, datetime(year, 1, 1),
+                           datetime(year + 1, 1, 1))
+
+
+def entries_on_this_day(c, tb, month, day):
+    """
+    Returns the names of the entries written on the same day of the year
+    in any year, newest first.
+    Each year is a range of the index, one lookup per year the diary
+    covers.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param month: month, 1 to 12
+    :type month: int
+    :param day: day of the month
+    :type day: int
+    :return: list of tuples containing a datetime and a hint
+    :rtype: list
+    """
+    # Separate queries, so each one reads a single end of the index
+    c.execute(f"SELECT min(ts) FROM {tb}")
+    first = c.fetchone()[0]
+    c.execute(f"SELECT max(ts) FROM {tb}")
+    last = c.fetchone()[0]
+    if first is None:
+        return []
+    names = []
+    for year in range((EPOCH + timedelta(seconds=last)).year,
+                      (EPOCH + timedelta(seconds=first)).year - 1, -1):
+        try:
+            start = datetime(year, month, day)
+        except ValueError:
+            # February 29 of a common year
+            continue
+        names += entries_between(c, tb, start, start + timedelta(days=1))
+    return names
+
+
+def entry_days(c, tb, year, month):
+    """
+    Returns the number of entries on each day of a month that has any,
+    e.g. to mark them on a calendar.
+    Only the index of column ts is read.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param year: year
+    :type year: int
+    :param month: month, 1 to 12
+    :type month: int
+    :return: numbers of entries by day of the month
+    :rtype: dict
+    """
+    c.execute(f"SELECT (ts - ?1) / {DAY} + 1 AS day, count(*) FROM {tb} "
+              f"WHERE ts >= ?1 AND ts < ?2 GROUP BY day",
+              (timestamp(datetime(year, month, 1)),
+               timestamp(next_month(year, month))))
+    return dict(c.fetchall())
+
+
+def calendar_entries(c, tb, when=""):
+    """
+    Returns the names of the entries of a year, a month or a day, or the
+    ones written on a day of the year in any year, newest first
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param when: e.g. "2018", "2018-01", "2018-01-02", "01-02" for January
+                 2 of every year, empty for today in every year
+    :type when: str
+    :return: list of tuples containing a datetime and a hint
+    :rtype: list
+    """
+    parts = when.split("-") if when.strip() else []
+    try:
+        numbers = [int(part) for part in parts]
+        if not numbers:
+            today = datetime.now()
+            return entries_on_this_day(c, tb, today.month, today.day)
+        if len(parts) == 1 and len(parts[0].strip()) == 4:
+            return entries_in_year(c, tb, *numbers)
+        if len(parts) == 2 and len(parts[0].strip()) == 4:
+            return entries_in_month(c, tb, *numbers)
+        if len(parts) == 2:
+            # Checked in a leap year, February 29 is a valid day
+            datetime(2000, *numbers)
+            return entries_on_this_day(c, tb, *numbers)
+        if len(parts) == 3:
+            start = datetime(*numbers)
+            return entries_between(c, tb, start, start + timedelta(days=1))
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid date {when}, use a year, a month or a day, "
+                     f"e.g. 2018, 2018-01, 2018-01-02 or 01-02...")
 
 
 def all_entry_names(c, tb):
@@ -162,10 +985,7 @@ def all_entry_names(c, tb):
     :return: list of tuples containing a datetime and a hint
     :rtype: list
     """
-    lst = []
-    for ent in c.execute(f"SELECT * FROM {tb} ORDER BY date DESC"):
-        lst.append((ent[0], ent[1]))
-    return lst
+    return list_entries(c, tb)
 
 
 def delete_entry(c, tb, dt):
@@ -180,7 +1000,26 @@ def delete_entry(c, tb, dt):
     :type dt: str
     """
     # Deletes an entry where its datetime matches 'dt'
-    c.execute(f"DELETE FROM {tb} WHERE date = '{dt}'")
+    c.execute(f"DELETE FROM {tb} WHERE date = ?", (dt,))
+    unindex_entry(c, tb, dt)
+    uncount_entry(c, tb, dt)
+    delete_revisions(c, tb, dt)
+
+
+def delete_all_entries(c, tb):
+    """
+    Deletes every entry by recreating table 'tb'
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    """
+    delete_table(c, tb)
+    create_main_table(c, tb)
+    clear_index(c, tb)
+    clear_stats(c, tb)
+    clear_revisions(c, tb)
 
 
 def delete_table(c, tb):
@@ -207,15 +1046,62 @@ def valid_password(c, psw):
     :rtype: bool
     """
     # Get stored hash from table hash
-    c.execute(f"SELECT hash FROM hash")
+    c.execute("SELECT hash FROM hash")
     hashed = (c.fetchone()[0]).encode("utf-8")
     return bcrypt.checkpw(psw.encode("utf-8"), hashed)
 
 
-def change_password(c, old_psw, new_psw, tb):
+def unlock(c, psw):
     """
-    Changes password by dropping then re-creating both the hash and the
-    entry tables
+    Validates password and derives the session key used to read and write
+    entries until the database is closed
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param psw: password
+    :type psw: str
+    :return: session key, None if the password is invalid
+    :rtype: SessionKey
+    """
+    if valid_password(c, psw):
+        return SessionKey(psw, authenticated(c))
+    return None
+
+
+def _entries_by_rowid(c, tb, batch):
+    """
+    Reads every entry of table 'tb' in rowid order, 'batch' rows at a time
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param batch: number of rows read at once
+    :type batch: int
+    :return: generator iterator of tuples containing a rowid and an entry
+    :rtype: generator
+    """
+    last = 0
+    while True:
+        c.execute(f"SELECT rowid, entry FROM {tb} WHERE rowid > ? "
+                  f"ORDER BY rowid LIMIT ?", (last, batch))
+        rows = c.fetchall()
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield from rows
+
+
+def change_password(c, old_psw, new_psw, tb, workers=None, progress=None,
+                    batch=500):
+    """
+    Changes password by replacing the stored hash and re-encrypting every
+    entry and revision in place.
+    Entries are read and written 'batch' rows at a time, so memory use
+    doesn't grow with the size of the diary. Nothing is committed, the
+    caller commits the whole change at once.
+    Every tag is checked before anything is written, a corrupt entry or
+    revision raises ValueError naming its date and nothing is changed.
 
     :param c: sqlite3 Cursor instance
     :type c: sqlite3.Cursor
@@ -225,26 +1111,610 @@ def change_password(c, old_psw, new_psw, tb):
     :type new_psw: str
     :param tb: table
     :type tb: str
+    :param workers: number of processes re-encrypting, defaults to the CPU
+                    count
+    :type workers: int
+    :param progress: called with the number of rows re-encrypted so far
+                     and the number of all rows after every batch
+    :type progress: function
+    :param batch: number of rows read and written at once
+    :type batch: int
     """
     if valid_password(c, old_psw):
-        # Recreate table hash
-        c.execute("DROP TABLE hash")
-        c.execute("CREATE TABLE hash (hash text)")
+        # Tampered entries are rejected instead of getting a new tag
+        old_key = SessionKey(old_psw, authenticated(c))
+        # Revisions are encrypted like entries
+        tables = [tb]
+        if has_revisions(c, tb):
+            tables.append(revisions_table(tb))
+        corrupt = []
+        for name in tables:
+            corrupt += verify_entries(c, name, old_key, workers)[2]
+        if corrupt:
+            raise ValueError(f"Corrupt entries: {', '.join(corrupt)}, "
+                             f"nothing was changed...")
         # Store salted hash from password
         hashed = bcrypt.hashpw(new_psw.encode("utf-8"), bcrypt.gensalt())
         hashed = hashed.decode("utf-8")
-        c.execute(f"INSERT INTO hash VALUES (\"{hashed}\")")
-        # Get the content of entry table
-        c.execute(f"SELECT * FROM {tb}")
-        to_re_encrypt = c.fetchall()
-        # Delete table
-        delete_table(c, tb)
-        # Recreate table
-        create_main_table(c, tb)
-        # Re-encrypt all entries and fill table
-        for i in to_re_encrypt:
-            # Decrypt only, add_entry() will do the encrypting
-            ent = decrypt(old_psw, i[2])
-            add_entry(c, tb, i[0], new_psw, ent, i[1])
+        c.execute("UPDATE hash SET hash = ?", (hashed,))
+        # The search index stays valid, only its secret is re-encrypted
+        rewrap_secret(c, old_key, new_psw)
+        total = 0
+        for name in tables:
+            c.execute(f"SELECT count(*) FROM {name}")
+            total += c.fetchone()[0]
+        done = 0
+        for name in tables:
+            pending = []
+            # Re-encrypt all rows on every core and write them back,
+            # reading with a separate cursor
+            rows = _entries_by_rowid(c.connection.cursor(), name, batch)
+            for rowid, ent in reencrypt_rows(old_key, new_psw, rows,
+                                             workers=workers):
+                pending.append((ent, rowid))
+                if len(pending) == batch:
+                    c.executemany(f"UPDATE {name} SET entry = ? "
+                                  f"WHERE rowid = ?", pending)
+                    done += len(pending)
+                    pending = []
+                    if progress is not None:
+                        progress(done, total)
+            c.executemany(f"UPDATE {name} SET entry = ? WHERE rowid = ?",
+                          pending)
+            done += len(pending)
+        # Every entry has been written with a tag
+        if storage_format(c) == FORMAT_BLOB:
+            set_authenticated(c)
+        if progress is not None:
+            progress(done, total)
     else:
         sys.exit("Invalid password.")
+
+
+def verify_entries(c, tb, key, workers=None):
+    """
+    Checks the authentication tag of every entry in table 'tb' on every
+    core, without decrypting them
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param workers: number of processes checking, defaults to the CPU count
+    :type workers: int
+    :return: number of entries, number of bytes checked, list of dates of
+             corrupt entries, list of dates of entries stored in a format
+             without a tag
+    :rtype: int, int, list, list
+    """
+    count = 0
+    size = 0
+    corrupt = []
+    unverifiable = []
+    rows = c.execute(f"SELECT date, length(entry), entry FROM {tb}")
+    for dt, length, ok in verify_rows(key, rows, workers=workers):
+        count += 1
+        size += length
+        if ok is None:
+            unverifiable.append(dt)
+        elif not ok:
+            corrupt.append(dt)
+    return count, size, corrupt, unverifiable
+
+
+class DiaryStore:
+    """
+    A diary kept open for a whole session.
+    One connection is reused by every method, so SQLite's page cache and
+    statement cache stay warm between actions. Each method is committed
+    when it returns, unless it is called inside transaction().
+    Threads other than the one that created the store should use their
+    own connection, e.g. open_database().
+    Decrypted entries are cached until they are written, or the store is
+    closed or gets another key, see d3lib.cache.EntryCache.
+    """
+
+    def __init__(self, db, tb, key=None, profile=DEFAULT_PROFILE,
+                 cache_size=DEFAULT_BUDGET):
+        """
+        :param db: filename
+        :type db: str
+        :param tb: table
+        :type tb: str
+        :param key: session key, see unlock()
+        :type key: SessionKey
+        :param profile: connection settings, "safe", "fast" or "bulk"
+        :type profile: str
+        :param cache_size: maximum number of bytes of decrypted text
+                           cached, 0 turns caching off
+        :type cache_size: int
+        """
+        self.db = db
+        self.tb = tb
+        self.key = key
+        self.cache = EntryCache(cache_size)
+        self.conn = sqlite3.connect(db)
+        # Number of nested transaction() scopes
+        self._depth = 0
+        try:
+            self.set_profile(profile)
+        except sqlite3.DatabaseError:
+            self.conn.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Closes the connection, the session key and the cached entries are
+        dropped too
+        """
+        self.key = None
+        self.cache.clear()
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups method calls into a single transaction that is committed at
+        the end of the outermost scope, or rolled back if anything raises
+
+        :return: generator iterator
+        :rtype: sqlite3.Cursor
+        """
+        self._depth += 1
+        c = self.conn.cursor()
+        try:
+            yield c
+        except BaseException:
+            if self._depth == 1:
+                self.conn.rollback()
+            raise
+        else:
+            if self._depth == 1:
+                self.conn.commit()
+        finally:
+            self._depth -= 1
+            c.close()
+
+    def set_profile(self, profile):
+        """
+        Changes the connection settings, pending changes are committed first
+
+        :param profile: "safe", "fast" or "bulk"
+        :type profile: str
+        """
+        self.conn.commit()
+        c = self.conn.cursor()
+        apply_profile(c, profile)
+        c.close()
+
+    def bulk(self, profile="bulk"):
+        """
+        Runs the block in a transaction of its own with the settings of
+        'profile', see bulk_profile()
+
+        :param profile: "safe", "fast" or "bulk"
+        :type profile: str
+        :return: context manager
+        :rtype: contextlib._GeneratorContextManager
+        """
+        return bulk_profile(self.conn.cursor(), profile)
+
+    def diagnostics(self):
+        """
+        Returns the profile and connection settings, see diagnostics(), and
+        the use of the entry cache
+
+        :return: values by name
+        :rtype: dict
+        """
+        with self.transaction() as c:
+            info = diagnostics(c)
+        # cache_size is SQLite's page cache, set by the profile
+        info["cached_entries"] = len(self.cache)
+        info["entry_cache_bytes"] = self.cache.size
+        info["entry_cache_hits"] = self.cache.hits
+        info["entry_cache_misses"] = self.cache.misses
+        return info
+
+    def unlock(self, psw):
+        """
+        Validates password and keeps the session key if it's valid
+
+        :param psw: password
+        :type psw: str
+        :return: True|False
+        :rtype: bool
+        """
+        with self.transaction() as c:
+            key = unlock(c, psw)
+        if key is not None:
+            self.key = key
+            self.cache.clear()
+        return key is not None
+
+    def valid_password(self, psw):
+        """
+        Validates password
+
+        :param psw: password
+        :type psw: str
+        :return: True|False
+        :rtype: bool
+        """
+        with self.transaction() as c:
+            return valid_password(c, psw)
+
+    def upgrade(self):
+        """Converts a database created by an earlier version"""
+        with self.transaction() as c:
+            upgrade_database(c, self.tb, self.key)
+
+    def add_entry(self, dt, ent, ht=""):
+        """
+        Adds a new entry
+
+        :param dt: datetime
+        :type dt: str
+        :param ent: entry
+        :type ent: str
+        :param ht: hint
+        :type ht: str
+        """
+        with self.transaction() as c:
+            add_entry(c, self.tb, dt, self.key, ent, ht)
+        self.cache.invalidate(dt)
+
+    def update_entry(self, dt, ent, ht=None):
+        """
+        Replaces the text, and optionally the hint, of an entry in place,
+        see update_entry()
+
+        :param dt: datetime
+        :type dt: str
+        :param ent: entry
+        :type ent: str
+        :param ht: hint, None keeps the stored one
+        :type ht: str
+        :return: True if the entry was written, False if it didn't change
+        :rtype: bool
+        """
+        with self.transaction() as c:
+            written = update_entry(c, self.tb, dt, self.key, ent, ht)
+        if written:
+            self.cache.invalidate(dt)
+        return written
+
+    def single_entry(self, dt):
+        """
+        Returns a decrypted entry, from the cache if it didn't change since
+        it was last decrypted
+
+        :param dt: datetime
+        :type dt: str
+        :return: decrypted entry
+        :rtype: str
+        """
+        with self.transaction() as c:
+            fingerprint = entry_fingerprint(c, self.tb, dt)
+            text = self.cache.get(dt, fingerprint)
+            if text is None:
+                text = single_entry(c, self.tb, dt, self.key)
+                self.cache.put(dt, fingerprint, text)
+        return text
+
+    def entry_stream(self, dt):
+        """
+        Returns a decrypted entry in pieces, see entry_stream().
+        A cached entry is returned in one piece, an entry read to the end is
+        cached.
+
+        :param dt: datetime
+        :type dt: str
+        :return: generator iterator of decrypted text
+        :rtype: generator
+        """
+        c = self.conn.cursor()
+        fingerprint = entry_fingerprint(c, self.tb, dt)
+        text = self.cache.get(dt, fingerprint)
+        if text is not None:
+            yield text
+            return
+        pieces = []
+        for piece in entry_stream(c, self.tb, dt, self.key):
+            pieces.append(piece)
+            yield piece
+        self.cache.put(dt, fingerprint, "".join(pieces))
+
+    def list_entries(self, after=None, limit=None):
+        """
+        Returns the names of entries, newest first, see list_entries()
+
+        :param after: datetime, only older entries are listed
+        :type after: str
+        :param limit: maximum number of names, None lists every one
+        :type limit: int
+        :return: list of tuples containing a datetime and a hint
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return list_entries(c, self.tb, after, limit)
+
+    def entry_names(self, page=PAGE_SIZE):
+        """
+        Returns the names of all entries one page at a time, see
+        entry_names()
+
+        :param page: number of names in a page
+        :type page: int
+        :return: generator iterator of lists of tuples containing a
+                 datetime and a hint
+        :rtype: generator
+        """
+        return entry_names(self.conn.cursor(), self.tb, page)
+
+    def all_entry_names(self):
+        """
+        Returns the names of all entries
+
+        :return: list of tuples containing a datetime and a hint
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return all_entry_names(c, self.tb)
+
+    def entries_between(self, start, end):
+        """
+        Returns the names of entries from 'start' up to, but not including,
+        'end', see entries_between()
+
+        :param start: first date, e.g. 2018-01-02 or 2018-01-02 12:34:56
+        :type start: str|datetime.datetime
+        :param end: date after the last one
+        :type end: str|datetime.datetime
+        :return: list of tuples containing a datetime and a hint, newest
+                 first
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return entries_between(c, self.tb, start, end)
+
+    def entries_in_month(self, year, month):
+        """
+        Returns the names of the entries of a month
+
+        :param year: year
+        :type year: int
+        :param month: month, 1 to 12
+        :type month: int
+        :return: list of tuples containing a datetime and a hint, newest
+                 first
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return entries_in_month(c, self.tb, year, month)
+
+    def entries_in_year(self, year):
+        """
+        Returns the names of the entries of a year
+
+        :param year: year
+        :type year: int
+        :return: list of tuples containing a datetime and a hint, newest
+                 first
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return entries_in_year(c, self.tb, year)
+
+    def entries_on_this_day(self, month, day):
+        """
+        Returns the names of the entries written on a day of the year in
+        any year, see entries_on_this_day()
+
+        :param month: month, 1 to 12
+        :type month: int
+        :param day: day of the month
+        :type day: int
+        :return: list of tuples containing a datetime and a hint, newest
+                 first
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return entries_on_this_day(c, self.tb, month, day)
+
+    def entry_days(self, year, month):
+        """
+        Returns the number of entries on each day of a month that has any
+
+        :param year: year
+        :type year: int
+        :param month: month, 1 to 12
+        :type month: int
+        :return: numbers of entries by day of the month
+        :rtype: dict
+        """
+        with self.transaction() as c:
+            return entry_days(c, self.tb, year, month)
+
+    def calendar_entries(self, when=""):
+        """
+        Returns the names of the entries of a year, a month, a day or a day
+        of every year, see calendar_entries()
+
+        :param when: e.g. "2018", "2018-01", "2018-01-02" or "01-02"
+        :type when: str
+        :return: list of tuples containing a datetime and a hint, newest
+                 first
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return calendar_entries(c, self.tb, when)
+
+    def delete_entry(self, dt):
+        """
+        Deletes an entry
+
+        :param dt: datetime
+        :type dt: str
+        """
+        with self.transaction() as c:
+            delete_entry(c, self.tb, dt)
+        self.cache.invalidate(dt)
+
+    def delete_all_entries(self):
+        """Deletes every entry"""
+        with self.transaction() as c:
+            delete_all_entries(c, self.tb)
+        self.cache.clear()
+
+    def create_search_index(self, workers=None, progress=None):
+        """
+        Creates the search index, or brings it up to date, see
+        d3lib.search.create_index()
+
+        :param workers: number of processes indexing
+        :type workers: int
+        :param progress: called with the number of entries indexed so far
+                         and the number of entries missing
+        :type progress: function
+        :return: number of entries indexed
+        :rtype: int
+        """
+        with self.transaction() as c:
+            return create_index(c, self.tb, self.key, workers, progress)
+
+    def unindexed_entries(self):
+        """
+        Returns the number of entries the next search indexes first, see
+        d3lib.search.unindexed()
+
+        :return: number of entries
+        :rtype: int
+        """
+        with self.transaction() as c:
+            return unindexed(c, self.tb)
+
+    def search(self, query, workers=None, progress=None):
+        """
+        Finds the entries having every word and prefix in 'query', see
+        d3lib.search.search_entries()
+
+        :param query: words and prefixes ending with *, e.g. "walk* park"
+        :type query: str
+        :param workers: number of processes decrypting
+        :type workers: int
+        :param progress: called while the index is being created, see
+                         create_search_index()
+        :type progress: function
+        :return: list of tuples containing a datetime and a hint, newest
+                 first
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return search_entries(c, self.tb, self.key, query, workers,
+                                  progress)
+
+    def revisions(self, dt):
+        """
+        Returns the revisions of an entry, see
+        d3lib.revisions.revision_list()
+
+        :param dt: datetime
+        :type dt: str
+        :return: list of tuples containing a number, the date and time it
+                 was saved, True for a snapshot and the number of bytes
+                 stored, oldest first
+        :rtype: list
+        """
+        with self.transaction() as c:
+            return revision_list(c, self.tb, dt)
+
+    def revision(self, dt, number):
+        """
+        Returns the text of a revision of an entry, see
+        d3lib.revisions.revision_text()
+
+        :param dt: datetime
+        :type dt: str
+        :param number: revision number
+        :type number: int
+        :return: text
+        :rtype: str
+        """
+        with self.transaction() as c:
+            return revision_text(c, self.tb, self.key, dt, number)
+
+    def create_stats(self, workers=None, progress=None):
+        """
+        Creates the statistics table, or brings it up to date, see
+        d3lib.stats.create_stats()
+
+        :param workers: number of processes decrypting
+        :type workers: int
+        :param progress: called with the number of entries counted so far
+                         and the number of entries missing
+        :type progress: function
+        :return: number of entries counted
+        :rtype: int
+        """
+        with self.transaction() as c:
+            return create_stats(c, self.tb, self.key, workers, progress)
+
+    def uncounted_entries(self):
+        """
+        Returns the number of entries the next statistics count first, see
+        d3lib.stats.uncounted()
+
+        :return: number of entries
+        :rtype: int
+        """
+        with self.transaction() as c:
+            return uncounted(c, self.tb)
+
+    def statistics(self, year=None, by="words", limit=10, workers=None,
+                   progress=None):
+        """
+        Returns the totals, the monthly totals and the longest entries, see
+        d3lib.stats. Entries missing from the statistics are counted first,
+        nothing else is decrypted.
+
+        :param year: only the months of this year, every month if None
+        :type year: int
+        :param by: number the longest entries are chosen by, e.g. "words"
+        :type by: str
+        :param limit: number of longest entries
+        :type limit: int
+        :param workers: number of processes decrypting
+        :type workers: int
+        :param progress: see create_stats()
+        :type progress: function
+        :return: totals by name, list of monthly totals, list of longest
+                 entries
+        :rtype: dict, list, list
+        """
+        with self.transaction() as c:
+            create_stats(c, self.tb, self.key, workers, progress)
+            return (totals(c, self.tb), monthly_totals(c, self.tb, year),
+                    longest_entries(c, self.tb, by, limit))
+
+    def verify_entries(self, workers=None):
+        """
+        Checks the authentication tag of every entry, see verify_entries()
+
+        :param workers: number of processes checking
+        :type workers: int
+        :return: number of entries, number of bytes checked, list of dates
+                 of corrupt entries, list of dates of entries stored in a
+                 format without a tag
+        :rtype: int, int, list, list
+        """
+        with self.transaction() as c:
+            return verify_entries(c, self.tb, self.key, workers)
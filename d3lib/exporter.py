@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import io
+import json
+import os
+import re
+import sys
+import tarfile
+import time
+from .parallel import decrypt_rows
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Characters not allowed in file names on some systems
+UNSAFE = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def date_range(start=None, end=None):
+    """
+    Completes the dates limiting an export, a day without a time means the
+    whole day
+
+    :param start: first date, e.g. 2018-01-02 or 2018-01-02 12:34:56
+    :type start: str
+    :param end: last date, e.g. 2018-12-31 or 2018-12-31 12:34:56
+    :type end: str
+    :return: first and last date and time, None if not limited
+    :rtype: str, str
+    """
+    if start is not None and len(start) == 10:
+        start += " 00:00:00"
+    if end is not None and len(end) == 10:
+        end += " 23:59:59"
+    return start, end
+
+
+def read_rows(c, tb, key, start=None, end=None, workers=None):
+    """
+    Reads and decrypts the entries of table 'tb' in date order, on every
+    core.
+    Rows are read from the database as they are needed and only the ones
+    being decrypted are held in memory.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param start: first date and time, see date_range()
+    :type start: str
+    :param end: last date and time, see date_range()
+    :type end: str
+    :param workers: number of processes decrypting, defaults to the CPU
+                    count
+    :type workers: int
+    :return: generator iterator of tuples containing a date, a hint and a
+             text
+    :rtype: generator
+    """
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("date >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("date <= ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    c.execute(f"SELECT date, hint, entry FROM {tb} {where}ORDER BY date",
+              params)
+    return decrypt_rows(key, c, workers=workers)
+
+
+def file_name(dt, ht, extension):
+    """
+    Returns a file name that d3lib.importer.read_directory() reads back,
+    e.g. "2018-01-02 12-34-56 hint.md"
+
+    :param dt: date and time
+    :type dt: str
+    :param ht: hint
+    :type ht: str
+    :param extension: file name extension
+    :type extension: str
+    :return: file name
+    :rtype: str
+    """
+    name = dt.replace(":", "-")
+    if ht:
+        name += " " + UNSAFE.sub("_", ht)[:100]
+    return name + extension
+
+
+def modification_time(dt):
+    """
+    Converts a diary date to a local timestamp, slicing is a lot
+    faster than time.strptime()
+
+    :param dt: date and time like 2018-01-02 12:34:56
+    :type dt: str
+    :return: seconds since the epoch, the current time if 'dt' is invalid
+    :rtype: int
+    """
+    try:
+        return int(time.mktime((int(dt[:4]), int(dt[5:7]), int(dt[8:10]),
+                                int(dt[11:13]), int(dt[14:16]),
+                                int(dt[17:19]), 0, 0, -1)))
+    except (ValueError, OverflowError):
+        return int(time.time())
+
+
+def write_jsonl(rows, target):
+    """
+    Writes entries as JSON objects with keys date, hint and entry, one on
+    each line
+
+    :param rows: tuples containing a date, a hint and a text
+    :type rows: iterable
+    :param target: filename, "-" writes to the standard output
+    :type target: str
+    :return: number of entries, number of bytes of text
+    :rtype: int, int
+    """
+    count = 0
+    size = 0
+    f = sys.stdout if target == "-" else open(target, "w", encoding="utf-8")
+    try:
+        for dt, ht, ent in rows:
+            line = json.dumps({"date": dt, "hint": ht, "entry": ent},
+                              ensure_ascii=False) + "\n"
+            f.write(line)
+            count += 1
+            size += len(ent.encode("utf-8"))
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count, size
+
+
+def write_markdown(rows, target):
+    """
+    Writes each entry in a Markdown file of its own, named by
+    file_name()
+
+    :param rows: tuples containing a date, a hint and a text
+    :type rows: iterable
+    :param target: directory, created if it doesn't exist
+    :type target: str
+    :return: number of entries, number of bytes of text
+    :rtype: int, int
+    """
+    count = 0
+    size = 0
+    os.makedirs(target, exist_ok=True)
+    for dt, ht, ent in rows:
+        with open(os.path.join(target, file_name(dt, ht, ".md")), "w",
+                  encoding="utf-8") as f:
+            f.write(ent)
+        count += 1
+        size += len(ent.encode("utf-8"))
+    return count, size
+
+
+def write_tar(rows, target):
+    """
+    Writes every entry in a single tar stream, as Markdown files named by
+    file_name()
+
+    :param rows: tuples containing a date, a hint and a text
+    :type rows: iterable
+    :param target: filename, "-" writes to the standard output
+    :type target: str
+    :return: number of entries, number of bytes of text
+    :rtype: int, int
+    """
+    count = 0
+    size = 0
+    # GNU headers are half the work of the default pax ones and still hold
+    # long and non-ASCII names
+    if target == "-":
+        tar = tarfile.open(fileobj=sys.stdout.buffer, mode="w|",
+                           format=tarfile.GNU_FORMAT)
+    else:
+        tar = tarfile.open(target, mode="w|", format=tarfile.GNU_FORMAT)
+    with tar:
+        for dt, ht, ent in rows:
+            data = ent.encode("utf-8")
+            info = tarfile.TarInfo(file_name(dt, ht, ".md"))
+            info.size = len(data)
+            info.mtime = modification_time(dt)
+            tar.addfile(info, io.BytesIO(data))
+            count += 1
+            size += len(data)
+    return count, size
+
+
+# Writers by format name
+WRITERS = {
+    "jsonl": write_jsonl,
+    "markdown": write_markdown,
+    "tar": write_tar,
+}
+
+
+def export_format(target):
+    """
+    Guesses the export format from the target: .tar files get a tar
+    stream, .jsonl files and the standard output get JSON lines, anything
+    else is a directory of Markdown files
+
+    :param target: filename or directory
+    :type target: str
+    :return: "jsonl", "markdown" or "tar"
+    :rtype: str
+    """
+    if target == "-" or target.lower().endswith((".jsonl", ".json")):
+        return "jsonl"
+    if target.lower().endswith(".tar"):
+        return "tar"
+    return "markdown"
+
+
+def export_entries(c, tb, key, target, fmt=None, start=None, end=None,
+                   workers=None):
+    """
+    Exports the entries of table 'tb' in date order with memory use that
+    doesn't grow with the size of the diary
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param target: filename or directory, "-" is the standard output
+    :type target: str
+    :param fmt: "jsonl", "markdown" or "tar", guessed from 'target' if None
+    :type fmt: str
+    :param start: first date, see date_range()
+    :type start: str
+    :param end: last date, see date_range()
+    :type end: str
+    :param workers: number of processes decrypting, defaults to the CPU
+                    count
+    :type workers: int
+    :return: number of entries, number of bytes of text, seconds taken
+    :rtype: int, int, float
+    """
+    begin = time.perf_counter()
+    start, end = date_range(start, end)
+    rows = read_rows(c, tb, key, start, end, workers)
+    count, size = WRITERS[fmt or export_format(target)](rows, target)
+    return count, size, time.perf_counter() - begin
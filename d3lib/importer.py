@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from .dbtools import insert_statement
+from .parallel import encrypt_rows
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Format of the dates in the diary, e.g. 2018-01-02 12:34:56
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Other formats accepted in imported files
+INPUT_FORMATS = (DATE_FORMAT, "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M",
+                 "%Y-%m-%dT%H:%M", "%Y-%m-%d")
+# Number of rows inserted at once
+BATCH_SIZE = 1000
+
+# Names of dated text files, e.g. "2018-01-02 12-34-56 hint.txt" or
+# "2018-01-02.md", the time and the hint are optional
+FILE_NAME = re.compile(r"(\d{4}-\d{2}-\d{2})"
+                       r"(?:[ T_](\d{2})[-:.]?(\d{2})(?:[-:.]?(\d{2}))?)?"
+                       r"[ _-]*(.*)")
+
+
+def normalize_date(dt):
+    """
+    Converts a date in any of INPUT_FORMATS to DATE_FORMAT
+
+    :param dt: date and time
+    :type dt: str
+    :return: date and time like 2018-01-02 12:34:56
+    :rtype: str
+    """
+    for fmt in INPUT_FORMATS:
+        try:
+            return datetime.strptime(dt.strip(), fmt).strftime(DATE_FORMAT)
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date {dt}...")
+
+
+def _entry(row, where):
+    """
+    Checks the fields of a row read from a file and normalizes its date
+
+    :param row: values by field name, date, entry and optionally hint
+    :type row: dict
+    :param where: position of the row in the file, e.g. "line 3"
+    :type where: str
+    :return: date, hint and text
+    :rtype: tuple
+    :raises ValueError: starting with 'where' if the row is invalid
+    """
+    if not isinstance(row, dict):
+        raise ValueError(f"{where}: Not an object with a date and an "
+                         f"entry...")
+    for name in ("date", "entry"):
+        if not isinstance(row.get(name), str):
+            raise ValueError(f"{where}: Missing {name}...")
+    try:
+        dt = normalize_date(row["date"])
+    except ValueError as error:
+        raise ValueError(f"{where}: {error}") from None
+    return dt, row.get("hint") or "", row["entry"]
+
+
+def read_jsonl(file):
+    """
+    Reads entries from a file with a JSON object on each line, having keys
+    date, entry and optionally hint
+
+    :param file: filename
+    :type file: str
+    :return: generator iterator of tuples containing a date, a hint and a
+             text
+    :rtype: generator
+    :raises ValueError: naming the line of an invalid entry
+    """
+    with open(file, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                raise ValueError(f"line {number}: Invalid JSON...") from None
+            yield _entry(row, f"line {number}")
+
+
+def read_csv(file):
+    """
+    Reads entries from a CSV file with a header naming columns date, entry
+    and optionally hint
+
+    :param file: filename
+    :type file: str
+    :return: generator iterator of tuples containing a date, a hint and a
+             text
+    :rtype: generator
+    :raises ValueError: naming the row of an invalid entry
+    """
+    # Entries are longer than the default limit of 128 KiB
+    csv.field_size_limit(2 ** 31 - 1)
+    with open(file, encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        # The header is row 1
+        number = 1
+        while True:
+            number += 1
+            try:
+                row = next(reader, None)
+            except csv.Error as error:
+                raise ValueError(f"row {number}: {error}...") from None
+            if row is None:
+                return
+            yield _entry(row, f"row {number}")
+
+
+def read_directory(path):
+    """
+    Reads entries from the text files of a directory, in name order.
+    File names start with the date, optionally followed by the time and the
+    hint, e.g. "2018-01-02 12-34-56 hint.txt", files named otherwise are
+    skipped.
+
+    :param path: directory
+    :type path: str
+    :return: generator iterator of tuples containing a date, a hint and a
+             text
+    :rtype: generator
+    :raises ValueError: naming the file of an invalid date
+    """
+    for name in sorted(os.listdir(path)):
+        file = os.path.join(path, name)
+        match = FILE_NAME.fullmatch(os.path.splitext(name)[0])
+        if match is None or not os.path.isfile(file):
+            continue
+        day, hour, minute, second, hint = match.groups()
+        dt = f"{day} {hour or '00'}:{minute or '00'}:{second or '00'}"
+        try:
+            dt = normalize_date(dt)
+        except ValueError as error:
+            raise ValueError(f"{name}: {error}") from None
+        with open(file, encoding="utf-8") as f:
+            yield dt, hint, f.read()
+
+
+def read_entries(source):
+    """
+    Reads entries from a directory, a .csv file or a JSON lines file
+
+    :param source: directory or filename
+    :type source: str
+    :return: generator iterator of tuples containing a date, a hint and a
+             text
+    :rtype: generator
+    """
+    if os.path.isdir(source):
+        return read_directory(source)
+    if source.lower().endswith(".csv"):
+        return read_csv(source)
+    return read_jsonl(source)
+
+
+def import_entries(c, tb, key, rows, workers=None, batch=BATCH_SIZE):
+    """
+    Encrypts entries on every core and inserts them into table 'tb',
+    'batch' rows at a time.
+    A date that is already taken is moved forward a second at a time until
+    it's free, so importing the same rows in the same order always gives
+    the same dates. Only the rows being encrypted are held in memory.
+    Nothing is committed, the caller commits the whole import at once.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param rows: tuples containing a date, a hint and a text
+    :type rows: iterable
+    :param workers: number of processes encrypting, defaults to the CPU
+                    count
+    :type workers: int
+    :param batch: number of rows inserted at once
+    :type batch: int
+    :return: number of entries imported, number of dates moved
+    :rtype: int, int
+    """
+    lookup = c.connection.cursor()
+    # Dates given to rows that aren't inserted yet
+    pending = set()
+    moved = 0
+
+    def taken(dt):
+        if dt in pending:
+            return True
+        lookup.execute(f"SELECT 1 FROM {tb} WHERE date = ?", (dt,))
+        return lookup.fetchone() is not None
+
+    def next_free(dt):
+        # Walk the later dates in the index instead of looking up every
+        # second, dates sort the same as text and as time
+        lookup.execute(f"SELECT date FROM {tb} WHERE date > ? "
+                       f"ORDER BY date", (dt,))
+        later = (row[0] for row in lookup)
+        following = next(later, None)
+        stamp = datetime.strptime(dt, DATE_FORMAT)
+        while True:
+            stamp += timedelta(seconds=1)
+            dt = stamp.strftime(DATE_FORMAT)
+            while following is not None and following < dt:
+                following = next(later, None)
+            if dt != following and dt not in pending:
+                return dt
+
+    def resolve():
+        nonlocal moved
+        for dt, ht, ent in rows:
+            dt = normalize_date(dt)
+            if taken(dt):
+                moved += 1
+                dt = next_free(dt)
+            pending.add(dt)
+            yield dt, ht, ent
+
+    count = 0
+    insert = []
+    for row in encrypt_rows(key, resolve(), workers=workers):
+        insert.append(row)
+        if len(insert) == batch:
+            c.executemany(insert_statement(tb), insert)
+            pending.difference_update(dt for dt, _, _ in insert)
+            count += len(insert)
+            insert = []
+    c.executemany(insert_statement(tb), insert)
+    lookup.close()
+    return count + len(insert), moved
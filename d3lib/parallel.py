@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from .crypter import (
+    FORMAT_COMPRESSED,
+    encrypt_many,
+    decrypt_many,
+    verify_many)
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Number of rows sent to a worker process at once
+CHUNK_SIZE = 256
+# Workers are started from a clean process instead of a fork, pools are
+# used from Qt threads and forking copies locks held by other threads
+START_METHOD = "forkserver" \
+    if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def chunks(items, size):
+    """
+    Splits an iterable into lists of length 'size', the last one may be
+    shorter
+
+    :param items: items to be split
+    :type items: iterable
+    :param size: chunk size
+    :type size: int
+    :return: generator iterator of lists
+    :rtype: generator
+    """
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap_chunks(func, items, chunk_size=CHUNK_SIZE, workers=None,
+                max_pending=None):
+    """
+    Applies 'func' to chunks of 'items' on a process pool and yields the
+    results in input order.
+    'func' takes a list and returns a list, it has to be picklable, i.e. a
+    module level function or a functools.partial of one.
+    At most 'max_pending' chunks are submitted but not yet consumed, so
+    memory stays bounded no matter how many items there are.
+    Input that fits in a single chunk is processed in this process.
+
+    :param func: function to be applied to each chunk
+    :type func: function
+    :param items: items to be processed
+    :type items: iterable
+    :param chunk_size: number of items sent to a worker at once
+    :type chunk_size: int
+    :param workers: number of worker processes, defaults to the CPU count
+    :type workers: int
+    :param max_pending: number of chunks in flight, defaults to 2 * workers
+    :type max_pending: int
+    :return: generator iterator of processed items
+    :rtype: generator
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * workers
+    parts = chunks(items, chunk_size)
+    first = next(parts, [])
+    second = next(parts, None)
+
+    # Not worth starting a pool
+    if workers <= 1 or second is None:
+        yield from func(first)
+        if second is not None:
+            yield from func(second)
+            for chunk in parts:
+                yield from func(chunk)
+        return
+
+    context = multiprocessing.get_context(START_METHOD)
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        pending = deque([pool.submit(func, first), pool.submit(func, second)])
+        try:
+            for chunk in parts:
+                # Wait for the oldest chunk before reading more input
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+                pending.append(pool.submit(func, chunk))
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # Don't compute chunks nobody will read
+            for future in pending:
+                future.cancel()
+
+
+def _encrypt_chunk(psw, rows):
+    """
+    Encrypts the last item of each row
+
+    :param psw: password or session key
+    :type psw: str|SessionKey
+    :param rows: rows ending with a plain text entry
+    :type rows: list
+    :return: rows ending with an encrypted entry
+    :rtype: list
+    """
+    entries = encrypt_many(psw, (row[-1] for row in rows),
+                           FORMAT_COMPRESSED)
+    return [tuple(row[:-1]) + (ent,) for row, ent in zip(rows, entries)]
+
+
+def _decrypt_chunk(psw, rows):
+    """
+    Decrypts the last item of each row
+
+    :param psw: password or session key
+    :type psw: str|SessionKey
+    :param rows: rows ending with an encrypted entry
+    :type rows: list
+    :return: rows ending with a decrypted entry
+    :rtype: list
+    """
+    entries = decrypt_many(psw, (row[-1] for row in rows))
+    return [tuple(row[:-1]) + (ent,) for row, ent in zip(rows, entries)]
+
+
+def _reencrypt_chunk(old_psw, new_psw, rows):
+    """
+    Re-encrypts the last item of each row with a new password
+
+    :param old_psw: old password or session key
+    :type old_psw: str|SessionKey
+    :param new_psw: new password or session key
+    :type new_psw: str|SessionKey
+    :param rows: rows ending with an entry encrypted with 'old_psw'
+    :type rows: list
+    :return: rows ending with an entry encrypted with 'new_psw'
+    :rtype: list
+    """
+    entries = encrypt_many(
+        new_psw, decrypt_many(old_psw, (row[-1] for row in rows)),
+        FORMAT_COMPRESSED)
+    return [tuple(row[:-1]) + (ent,) for row, ent in zip(rows, entries)]
+
+
+def _verify_chunk(psw, rows):
+    """
+    Checks the authentication tag of the last item of each row
+
+    :param psw: password or session key
+    :type psw: str|SessionKey
+    :param rows: rows ending with an encrypted entry
+    :type rows: list
+    :return: rows ending with True|False|None, see crypter.verify_entry()
+    :rtype: list
+    """
+    results = verify_many(psw, (row[-1] for row in rows))
+    return [tuple(row[:-1]) + (ok,) for row, ok in zip(rows, results)]
+
+
+def encrypt_rows(psw, rows, chunk_size=CHUNK_SIZE, workers=None):
+    """
+    Encrypts the last item of each row in parallel, e.g. rows of
+    (date, hint, entry) from table 'diary'
+
+    :param psw: password or session key
+    :type psw: str|SessionKey
+    :param rows: rows ending with a plain text entry
+    :type rows: iterable
+    :param chunk_size: number of rows sent to a worker at once
+    :type chunk_size: int
+    :param workers: number of worker processes
+    :type workers: int
+    :return: generator iterator of rows in input order
+    :rtype: generator
+    """
+    return imap_chunks(partial(_encrypt_chunk, psw), rows,
+                       chunk_size, workers)
+
+
+def decrypt_rows(psw, rows, chunk_size=CHUNK_SIZE, workers=None):
+    """
+    Decrypts the last item of each row in parallel
+
+    :param psw: password or session key
+    :type psw: str|SessionKey
+    :param rows: rows ending with an encrypted entry
+    :type rows: iterable
+    :param chunk_size: number of rows sent to a worker at once
+    :type chunk_size: int
+    :param workers: number of worker processes
+    :type workers: int
+    :return: generator iterator of rows in input order
+    :rtype: generator
+    """
+    return imap_chunks(partial(_decrypt_chunk, psw), rows,
+                       chunk_size, workers)
+
+
+def reencrypt_rows(old_psw, new_psw, rows, chunk_size=CHUNK_SIZE,
+                   workers=None):
+    """
+    Re-encrypts the last item of each row in parallel with a new password
+
+    :param old_psw: old password or session key
+    :type old_psw: str|SessionKey
+    :param new_psw: new password or session key
+    :type new_psw: str|SessionKey
+    :param rows: rows ending with an entry encrypted with 'old_psw'
+    :type rows: iterable
+    :param chunk_size: number of rows sent to a worker at once
+    :type chunk_size: int
+    :param workers: number of worker processes
+    :type workers: int
+    :return: generator iterator of rows in input order
+    :rtype: generator
+    """
+    return imap_chunks(partial(_reencrypt_chunk, old_psw, new_psw), rows,
+                       chunk_size, workers)
+
+
+def verify_rows(psw, rows, chunk_size=CHUNK_SIZE, workers=None):
+    """
+    Checks the authentication tag of the last item of each row in parallel,
+    without decrypting anything
+
+    :param psw: password or session key
+    :type psw: str|SessionKey
+    :param rows: rows ending with an encrypted entry
+    :type rows: iterable
+    :param chunk_size: number of rows sent to a worker at once
+    :type chunk_size: int
+    :param workers: number of worker processes
+    :type workers: int
+    :return: generator iterator of rows in input order, ending with
+             True|False|None
+    :rtype: generator
+    """
+    return imap_chunks(partial(_verify_chunk, psw), rows,
+                       chunk_size, workers)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import re
+from datetime import datetime
+from difflib import SequenceMatcher
+from .crypter import decrypt_many, encrypt_entry
+from .sidetables import has_table
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Longest chain of deltas after a snapshot, so showing a revision never
+# applies more than this many
+MAX_CHAIN = 64
+# The deltas after a snapshot take at most this many times its size, so
+# showing a revision never decrypts much more than a few copies of it
+MAX_CHAIN_SIZE = 2
+# Most pieces compared after the beginning and the end both texts share
+# are cut off, a longer change is stored as a snapshot, comparing takes
+# time that grows with the square of this
+MAX_DIFF = 2000
+
+# Texts are compared as words with the whitespace after them, an edit in a
+# long paragraph doesn't store the whole paragraph again
+TOKEN = re.compile(r"\s+|\S+\s*")
+
+
+def revisions_table(tb):
+    """
+    Returns the name of the table holding the revisions of table 'tb'
+
+    :param tb: table
+    :type tb: str
+    :return: table name
+    :rtype: str
+    """
+    return f"{tb}_revisions"
+
+
+def tokenize(text):
+    """
+    Splits a text into the pieces deltas refer to
+
+    :param text: text
+    :type text: str
+    :return: pieces, joined they give back 'text'
+    :rtype: list
+    """
+    return TOKEN.findall(text)
+
+
+def make_delta(old, new):
+    """
+    Returns what turns the pieces of 'old' into the pieces of 'new' as
+    JSON: a list of ranges of the pieces of 'old' to copy, e.g. [0, 12], and
+    lists of pieces to insert, e.g. ["new ", "words "].
+    The beginning and the end the texts share are found in linear time,
+    only the part between them is compared piece by piece.
+
+    :param old: previous text
+    :type old: str
+    :param new: new text
+    :type new: str
+    :return: JSON text, None if more than MAX_DIFF pieces changed
+    :rtype: str
+    """
+    a = tokenize(old)
+    b = tokenize(new)
+    start = 0
+    while start < min(len(a), len(b)) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < min(len(a), len(b)) - start and \
+            a[len(a) - end - 1] == b[len(b) - end - 1]:
+        end += 1
+    middle_a = a[start:len(a) - end]
+    middle_b = b[start:len(b) - end]
+    if max(len(middle_a), len(middle_b)) > MAX_DIFF:
+        return None
+    delta = [[0, start]] if start else []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(
+            None, middle_a, middle_b, False).get_opcodes():
+        if tag == "equal":
+            delta.append([start + i1, start + i2])
+        elif j1 < j2:
+            delta.append(middle_b[j1:j2])
+    if end:
+        delta.append([len(a) - end, len(a)])
+    return json.dumps(delta, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_delta(old, delta):
+    """
+    Turns the pieces of the previous text into the pieces of the next one,
+    see make_delta().
+    Inserted pieces are kept as they were split, so the result is the same
+    as tokenize() on the next text without splitting it again.
+
+    :param old: pieces of the previous text
+    :type old: list
+    :param delta: JSON text
+    :type delta: str
+    :return: pieces of the next text
+    :rtype: list
+    """
+    new = []
+    for item in json.loads(delta):
+        if item and isinstance(item[0], int):
+            new += old[item[0]:item[1]]
+        else:
+            new += item
+    return new
+
+
+def has_revisions(c, tb):
+    """
+    Checks whether table 'tb' has a revisions table
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :return: True|False
+    :rtype: bool
+    """
+    return has_table(c, revisions_table(tb))
+
+
+def create_revisions_table(c, tb):
+    """
+    Creates the revisions table of table 'tb' if it doesn't exist.
+    Each row holds the date of an entry, the number of the revision, when
+    it was saved, whether it's a snapshot and the encrypted snapshot or
+    delta in column entry, so the rows are re-encrypted like entries.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    """
+    c.execute(f"CREATE TABLE IF NOT EXISTS {revisions_table(tb)} ("
+              f"date datetime NOT NULL, number INTEGER NOT NULL, "
+              f"saved datetime NOT NULL, snapshot INTEGER NOT NULL, "
+              f"entry BLOB NOT NULL, UNIQUE (date, number))")
+
+
+def record_revision(c, tb, key, dt, old, new):
+    """
+    Records a save of an entry as a delta against the previous text.
+    The first save of an entry also records the text it replaces, as
+    revision 0 saved at the entry's date. A snapshot of the whole text is
+    stored instead of a delta when the deltas since the last snapshot
+    would take more than MAX_CHAIN_SIZE times its space, there are
+    MAX_CHAIN of them already, or the change is too long to compare, see
+    make_delta().
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param dt: datetime
+    :type dt: str
+    :param old: text replaced, None if it couldn't be decrypted
+    :type old: str
+    :param new: text saved
+    :type new: str
+    """
+    rv = revisions_table(tb)
+    create_revisions_table(c, tb)
+    c.execute(f"SELECT number, snapshot, length(entry) FROM {rv} "
+              f"WHERE date = ? ORDER BY number", (dt,))
+    rows = c.fetchall()
+    saved = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if not rows and old is not None:
+        data = encrypt_entry(key, old)
+        c.execute(f"INSERT INTO {rv} VALUES (?, 0, ?, 1, ?)", (dt, dt, data))
+        rows = [(0, 1, len(data))]
+    number = rows[-1][0] + 1 if rows else 0
+    # Sizes of the last snapshot and of the deltas after it
+    chain = []
+    for _, is_snapshot, size in rows:
+        chain = [size] if is_snapshot else chain + [size]
+    data = None
+    if old is not None and chain and len(chain) <= MAX_CHAIN:
+        delta = make_delta(old, new)
+        if delta is not None:
+            data = encrypt_entry(key, delta)
+            if sum(chain[1:]) + len(data) > MAX_CHAIN_SIZE * chain[0]:
+                data = None
+    is_snapshot = int(data is None)
+    if data is None:
+        data = encrypt_entry(key, new)
+    c.execute(f"INSERT INTO {rv} VALUES (?, ?, ?, ?, ?)",
+              (dt, number, saved, is_snapshot, data))
+
+
+def revision_list(c, tb, dt):
+    """
+    Returns the revisions of an entry, without decrypting them
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    :return: list of tuples containing a number, the date and time it was
+             saved, True for a snapshot and the number of bytes stored,
+             oldest first, empty if the entry was never changed
+    :rtype: list
+    """
+    if not has_revisions(c, tb):
+        return []
+    c.execute(f"SELECT number, saved, snapshot, length(entry) "
+              f"FROM {revisions_table(tb)} WHERE date = ? ORDER BY number",
+              (dt,))
+    return [(number, saved, bool(snapshot), size)
+            for number, saved, snapshot, size in c.fetchall()]
+
+
+def revision_text(c, tb, key, dt, number):
+    """
+    Returns the text of a revision, from the last snapshot before it and
+    the deltas after that
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param dt: datetime
+    :type dt: str
+    :param number: revision number, see revision_list()
+    :type number: int
+    :return: text
+    :rtype: str
+    """
+    rv = revisions_table(tb)
+    rows = []
+    if has_revisions(c, tb):
+        c.execute(f"SELECT number, entry FROM {rv} "
+                  f"WHERE date = ?1 AND number <= ?2 AND number >= ("
+                  f"SELECT max(number) FROM {rv} "
+                  f"WHERE date = ?1 AND number <= ?2 AND snapshot) "
+                  f"ORDER BY number", (dt, number))
+        rows = c.fetchall()
+    if not rows or rows[-1][0] != number:
+        raise ValueError(f"Entry with {dt} has no revision {number}...")
+    texts = decrypt_many(key, (data for _, data in rows))
+    pieces = tokenize(next(texts))
+    for delta in texts:
+        pieces = apply_delta(pieces, delta)
+    return "".join(pieces)
+
+
+def delete_revisions(c, tb, dt):
+    """
+    Drops the revisions of a deleted entry
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    """
+    if has_revisions(c, tb):
+        c.execute(f"DELETE FROM {revisions_table(tb)} WHERE date = ?", (dt,))
+
+
+def clear_revisions(c, tb):
+    """
+    Drops every revision, when every entry is deleted
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    """
+    if has_revisions(c, tb):
+        c.execute(f"DELETE FROM {revisions_table(tb)}")
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import hmac
+import os
+import re
+import unicodedata
+from functools import partial
+from operator import itemgetter
+from .crypter import decrypt_entry, decrypt_many, encrypt_entry
+from .parallel import decrypt_rows
+from .sidetables import (
+    BATCH_SIZE,
+    count_missing,
+    has_table,
+    refresh_side_table)
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Number of bytes of HMAC-SHA256 kept of each token, a false match is
+# found out when the entry is decrypted
+TOKEN_SIZE = 8
+# Words are also indexed by their first PREFIX characters, prefix queries
+# need at least that many
+PREFIX = 4
+# Key in table meta of the encrypted secret the tokens are made with
+SECRET = "search_key"
+
+WORD = re.compile(r"\w+")
+QUERY = re.compile(r"\w+\*?")
+
+
+def index_table(tb):
+    """
+    Returns the name of the table holding the tokens of table 'tb'
+
+    :param tb: table
+    :type tb: str
+    :return: table name
+    :rtype: str
+    """
+    return f"{tb}_search"
+
+
+def normalize(text):
+    """
+    Folds the case and the compatibility forms of a text, so "Straße" and
+    "STRASSE" are the same word
+
+    :param text: text
+    :type text: str
+    :return: normalized text
+    :rtype: str
+    """
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def words(text):
+    """
+    Returns the distinct words of a text
+
+    :param text: text
+    :type text: str
+    :return: normalized words
+    :rtype: set
+    """
+    return set(WORD.findall(normalize(text)))
+
+
+def terms(text):
+    """
+    Returns what an entry is indexed by: "w" and each word, and "p" and
+    the beginning of each word at least PREFIX characters long
+
+    :param text: entry
+    :type text: str
+    :return: terms
+    :rtype: set
+    """
+    found = set()
+    for word in words(text):
+        found.add("w" + word)
+        if len(word) >= PREFIX:
+            found.add("p" + word[:PREFIX])
+    return found
+
+
+def tokens(secret, items):
+    """
+    Returns the HMAC-SHA256 digests terms are stored as.
+    The key is set up once and copied for every term.
+
+    :param secret: search secret, see search_secret()
+    :type secret: bytes
+    :param items: terms, see terms()
+    :type items: iterable
+    :return: digests in the order of 'items'
+    :rtype: list
+    """
+    keyed = hmac.new(secret, digestmod=hashlib.sha256)
+    digests = []
+    for term in items:
+        h = keyed.copy()
+        h.update(term.encode("utf-8"))
+        digests.append(h.digest()[:TOKEN_SIZE])
+    return digests
+
+
+def parse_query(query):
+    """
+    Splits a query into words and prefixes, a word ending with * is a
+    prefix
+
+    :param query: e.g. "walk* park"
+    :type query: str
+    :return: list of words, list of prefixes
+    :rtype: list, list
+    """
+    whole = []
+    prefixes = []
+    for part in QUERY.findall(normalize(query)):
+        if part.endswith("*"):
+            if len(part) - 1 < PREFIX:
+                raise ValueError(f"Prefixes need at least {PREFIX} "
+                                 f"characters...")
+            prefixes.append(part[:-1])
+        else:
+            whole.append(part)
+    if not whole and not prefixes:
+        raise ValueError("Nothing to search for...")
+    return whole, prefixes
+
+
+def matches(text, whole, prefixes):
+    """
+    Checks that a text has every word and a word beginning with every
+    prefix
+
+    :param text: decrypted entry
+    :type text: str
+    :param whole: words
+    :type whole: list
+    :param prefixes: prefixes
+    :type prefixes: list
+    :return: True|False
+    :rtype: bool
+    """
+    found = words(text)
+    return all(word in found for word in whole) and \
+        all(any(word.startswith(p) for word in found) for p in prefixes)
+
+
+def has_index(c, tb):
+    """
+    Checks whether table 'tb' has a search index
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :return: True|False
+    :rtype: bool
+    """
+    return has_table(c, index_table(tb))
+
+
+def unindexed(c, tb):
+    """
+    Returns the number of entries a search would index first, every entry
+    if table 'tb' has no search index yet
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :return: number of entries
+    :rtype: int
+    """
+    return count_missing(c, tb, f"{index_table(tb)}_docs")
+
+
+def search_secret(c, key):
+    """
+    Returns the secret the tokens are made with, stored in table meta
+    encrypted with the diary's key, so changing the password doesn't change
+    the tokens
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param key: session key or password
+    :type key: SessionKey|str
+    :return: secret, None if there's no search index
+    :rtype: bytes
+    """
+    c.execute("SELECT value FROM meta WHERE key = ?", (SECRET,))
+    row = c.fetchone()
+    if row is None:
+        return None
+    return bytes.fromhex(decrypt_entry(key, row[0]))
+
+
+def rewrap_secret(c, old_key, new_key):
+    """
+    Encrypts the search secret with a new key, when the password changes
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param old_key: old session key or password
+    :type old_key: SessionKey|str
+    :param new_key: new session key or password
+    :type new_key: SessionKey|str
+    """
+    secret = search_secret(c, old_key)
+    if secret is not None:
+        c.execute("UPDATE meta SET value = ? WHERE key = ?",
+                  (encrypt_entry(new_key, secret.hex()), SECRET))
+
+
+def _index_chunk(psw, secret, rows):
+    """
+    Decrypts the last item of each row and replaces it with its tokens
+
+    :param psw: password or session key
+    :type psw: str|SessionKey
+    :param secret: search secret
+    :type secret: bytes
+    :param rows: rows ending with an encrypted entry
+    :type rows: list
+    :return: rows ending with a list of tokens
+    :rtype: list
+    """
+    entries = decrypt_many(psw, (row[-1] for row in rows))
+    return [tuple(row[:-1]) + (tokens(secret, terms(ent)),)
+            for row, ent in zip(rows, entries)]
+
+
+def _add_tokens(c, tb, dt, digests):
+    """
+    Records an entry as indexed and returns the rows of its tokens
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    :param digests: tokens of the entry
+    :type digests: list
+    :return: list of tuples containing a token and the entry's id
+    :rtype: list
+    """
+    c.execute(f"INSERT INTO {index_table(tb)}_docs (date, tokens) "
+              f"VALUES (?, ?)", (dt, b"".join(digests)))
+    doc = c.lastrowid
+    return [(t, doc) for t in digests]
+
+
+def _insert_tokens(c, tb, rows):
+    """
+    Inserts tokens in index order, so neighbouring rows land on the same
+    pages
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param rows: tuples containing a token and an id
+    :type rows: list
+    """
+    rows.sort(key=itemgetter(0))
+    # Tokens are truncated, two terms of an entry may share one
+    c.executemany(f"INSERT OR IGNORE INTO {index_table(tb)} VALUES (?, ?)",
+                  rows)
+
+
+def _write_index(c, tb, rows):
+    """
+    Records entries as indexed and inserts their tokens
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param rows: tuples containing a date and the tokens of the entry
+    :type rows: list
+    """
+    insert = []
+    for dt, digests in rows:
+        insert += _add_tokens(c, tb, dt, digests)
+    _insert_tokens(c, tb, insert)
+
+
+def _unindex_entries(c, tb, rows):
+    """
+    Drops the tokens of entries that are gone
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param rows: tuples containing a date
+    :type rows: list
+    """
+    for dt, in rows:
+        unindex_entry(c, tb, dt)
+
+
+def refresh_index(c, tb, key, workers=None, progress=None,
+                  batch=BATCH_SIZE):
+    """
+    Indexes entries written without updating the index, e.g. imported
+    ones, and drops the tokens of entries that are gone,
+    see d3lib.sidetables.refresh_side_table()
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param workers: number of processes indexing, defaults to the CPU count
+    :type workers: int
+    :param progress: called with the number of entries indexed so far and
+                     the number of entries missing after every batch
+    :type progress: function
+    :param batch: number of rows read and written at once
+    :type batch: int
+    :return: number of entries indexed
+    :rtype: int
+    """
+    secret = search_secret(c, key)
+    return refresh_side_table(
+        c, tb, f"{index_table(tb)}_docs",
+        partial(_index_chunk, key, secret), partial(_write_index, c, tb),
+        partial(_unindex_entries, c, tb), workers, progress, batch)
+
+
+def create_index(c, tb, key, workers=None, progress=None):
+    """
+    Creates the search index of table 'tb' if it doesn't exist, with a new
+    secret, and indexes every entry missing from it.
+    Each indexed entry gets a row in table 'tb'_search_docs with a number
+    and its tokens, and table 'tb'_search has a row for every token and
+    number. Nothing is committed.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param workers: number of processes indexing, defaults to the CPU count
+    :type workers: int
+    :param progress: see refresh_index()
+    :type progress: function
+    :return: number of entries indexed
+    :rtype: int
+    """
+    st = index_table(tb)
+    if search_secret(c, key) is None:
+        c.execute("INSERT INTO meta VALUES (?, ?)",
+                  (SECRET, encrypt_entry(key, os.urandom(32).hex())))
+    c.execute(f"CREATE TABLE IF NOT EXISTS {st}_docs ("
+              f"id INTEGER PRIMARY KEY, date TEXT NOT NULL UNIQUE, "
+              f"tokens BLOB NOT NULL)")
+    # A small number instead of the date keeps the rows short
+    c.execute(f"CREATE TABLE IF NOT EXISTS {st} ("
+              f"token BLOB NOT NULL, id INTEGER NOT NULL, "
+              f"PRIMARY KEY (token, id)) WITHOUT ROWID")
+    return refresh_index(c, tb, key, workers, progress)
+
+
+def index_entry(c, tb, key, dt, ent):
+    """
+    Replaces the tokens of an entry that was written, if table 'tb' has a
+    search index
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param dt: datetime
+    :type dt: str
+    :param ent: entry
+    :type ent: str
+    """
+    if not has_index(c, tb):
+        return
+    unindex_entry(c, tb, dt)
+    digests = tokens(search_secret(c, key), terms(ent))
+    _insert_tokens(c, tb, _add_tokens(c, tb, dt, digests))
+
+
+def unindex_entry(c, tb, dt):
+    """
+    Drops the tokens of a deleted entry, by the list kept with it
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    """
+    if not has_index(c, tb):
+        return
+    st = index_table(tb)
+    c.execute(f"SELECT id, tokens FROM {st}_docs WHERE date = ?", (dt,))
+    row = c.fetchone()
+    if row is None:
+        return
+    doc, digests = row
+    c.executemany(f"DELETE FROM {st} WHERE token = ? AND id = ?",
+                  [(digests[i:i + TOKEN_SIZE], doc)
+                   for i in range(0, len(digests), TOKEN_SIZE)])
+    c.execute(f"DELETE FROM {st}_docs WHERE id = ?", (doc,))
+
+
+def clear_index(c, tb):
+    """
+    Drops every token, when every entry is deleted
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    """
+    if has_index(c, tb):
+        c.execute(f"DELETE FROM {index_table(tb)}")
+        c.execute(f"DELETE FROM {index_table(tb)}_docs")
+
+
+def _candidates(c, tb, dates, batch):
+    """
+    Reads the hints and entries of 'dates', 'batch' rows at a time
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dates: datetimes
+    :type dates: list
+    :param batch: number of rows read at once
+    :type batch: int
+    :return: generator iterator of tuples containing a date, a hint and an
+             entry
+    :rtype: generator
+    """
+    for i in range(0, len(dates), batch):
+        part = dates[i:i + batch]
+        c.execute(f"SELECT date, hint, entry FROM {tb} WHERE date IN "
+                  f"({', '.join('?' * len(part))})", part)
+        yield from c.fetchall()
+
+
+def search_entries(c, tb, key, query, workers=None, progress=None):
+    """
+    Finds the entries of table 'tb' having every word of 'query', and a word
+    beginning with each prefix in it, e.g. "walk* park".
+    The index is looked up first and only the entries it finds are
+    decrypted. The index is created on the first search, see
+    create_index().
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param query: words and prefixes ending with *
+    :type query: str
+    :param workers: number of processes decrypting, defaults to the CPU
+                    count
+    :type workers: int
+    :param progress: see refresh_index()
+    :type progress: function
+    :return: list of tuples containing a datetime and a hint, newest first
+    :rtype: list
+    """
+    whole, prefixes = parse_query(query)
+    create_index(c, tb, key, workers, progress)
+    digests = tokens(search_secret(c, key),
+                     ["w" + word for word in whole] +
+                     ["p" + prefix[:PREFIX] for prefix in prefixes])
+    st = index_table(tb)
+    matching = " INTERSECT ".join(
+        [f"SELECT id FROM {st} WHERE token = ?"] * len(digests))
+    c.execute(f"SELECT date FROM {st}_docs WHERE id IN ({matching})",
+              digests)
+    dates = [row[0] for row in c.fetchall()]
+    found = []
+    for dt, ht, ent in decrypt_rows(key, _candidates(c, tb, dates, BATCH_SIZE),
+                                    workers=workers):
+        if matches(ent, whole, prefixes):
+            found.append((dt, ht))
+    found.sort(reverse=True)
+    return found
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+from .parallel import imap_chunks
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Number of entries read and written at once
+BATCH_SIZE = 500
+
+
+def has_table(c, name):
+    """
+    Checks whether the database has a table
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param name: table
+    :type name: str
+    :return: True|False
+    :rtype: bool
+    """
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+              (name,))
+    return c.fetchone() is not None
+
+
+def _count_missing(c, tb, side):
+    """
+    Counts the entries of table 'tb' missing from table 'side', and lists
+    the dates in 'side' whose entries are gone.
+    When the numbers of rows are the same this costs two counts.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param side: table keeping a row for every entry in its date column
+    :type side: str
+    :return: number of entries, list of tuples containing a date
+    :rtype: int, list
+    """
+    c.execute(f"SELECT count(*) FROM {tb}")
+    total = c.fetchone()[0]
+    c.execute(f"SELECT count(*) FROM {side}")
+    present = c.fetchone()[0]
+    if present == total:
+        return 0, []
+    # Entries deleted by something else than delete_entry()
+    c.execute(f"SELECT date FROM {side} "
+              f"WHERE date NOT IN (SELECT date FROM {tb})")
+    gone = c.fetchall()
+    return total - present + len(gone), gone
+
+
+def count_missing(c, tb, side):
+    """
+    Returns the number of entries of table 'tb' missing from table 'side',
+    every entry if there's no such table yet
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param side: table keeping a row for every entry in its date column
+    :type side: str
+    :return: number of entries
+    :rtype: int
+    """
+    if not has_table(c, side):
+        c.execute(f"SELECT count(*) FROM {tb}")
+        return c.fetchone()[0]
+    return _count_missing(c, tb, side)[0]
+
+
+def missing_entries(c, tb, side, batch=BATCH_SIZE):
+    """
+    Reads the entries of table 'tb' missing from table 'side', in rowid
+    order, 'batch' rows at a time
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param side: table keeping a row for every entry in its date column
+    :type side: str
+    :param batch: number of rows read at once
+    :type batch: int
+    :return: generator iterator of tuples containing a date and an entry
+    :rtype: generator
+    """
+    last = 0
+    while True:
+        # The + keeps SQLite from scanning the whole of the other table for
+        # every row instead of looking the date up
+        c.execute(f"SELECT rowid, date, entry FROM {tb} "
+                  f"WHERE rowid > ? AND NOT EXISTS ("
+                  f"SELECT 1 FROM {side} WHERE date = +{tb}.date) "
+                  f"ORDER BY rowid LIMIT ?", (last, batch))
+        rows = c.fetchall()
+        if not rows:
+            return
+        last = rows[-1][0]
+        for rowid, dt, ent in rows:
+            yield dt, ent
+
+
+def refresh_side_table(c, tb, side, process, write, drop, workers=None,
+                       progress=None, batch=BATCH_SIZE):
+    """
+    Brings table 'side' up to date with table 'tb' after entries were
+    written without updating it, e.g. imported ones: the rows of entries
+    that are gone are dropped, and the missing entries are processed on
+    every core and written.
+    When the numbers of rows are the same this costs two counts.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param side: table keeping a row for every entry in its date column
+    :type side: str
+    :param process: called in a worker process with a list of tuples
+                    containing a date and an encrypted entry, returns a
+                    list of rows, it has to be picklable
+    :type process: function
+    :param write: called with a list of rows returned by 'process'
+    :type write: function
+    :param drop: called with a list of tuples containing the date of an
+                 entry that is gone
+    :type drop: function
+    :param workers: number of processes, defaults to the CPU count
+    :type workers: int
+    :param progress: called with the number of entries processed so far
+                     and the number of entries missing after every batch
+    :type progress: function
+    :param batch: number of rows read and written at once
+    :type batch: int
+    :return: number of entries processed
+    :rtype: int
+    """
+    missing, gone = _count_missing(c, tb, side)
+    if gone:
+        drop(gone)
+    if missing == 0:
+        return 0
+    read = c.connection.cursor()
+    count = 0
+    pending = []
+    for row in imap_chunks(process, missing_entries(read, tb, side, batch),
+                           workers=workers):
+        pending.append(row)
+        count += 1
+        if count % batch == 0:
+            write(pending)
+            pending = []
+            if progress is not None:
+                progress(count, missing)
+    write(pending)
+    read.close()
+    if progress is not None:
+        progress(count, missing)
+    return count
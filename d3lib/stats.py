@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: D3TA (Dear Diary, Don't Tell Anyone)
+Package: d3lib
+
+Copyright (C) 2018  Korvin F. Ezüst
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import secrets
+from functools import partial
+from .crypter import decrypt_many
+from .search import WORD
+from .sidetables import (
+    BATCH_SIZE,
+    count_missing,
+    has_table,
+    refresh_side_table)
+
+__author__ = "Korvin F. Ezüst"
+__copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
+__license__ = "GNU General Public License version 3"
+__version__ = "1.0"
+__email__ = "dev@korvin.eu"
+__status__ = "Production"
+
+# Numbers kept of each entry, rounded to a multiple of their grain, so they
+# tell about as much as the length of the encrypted entry does
+GRAINS = {
+    "words": 8,
+    "chars": 64,
+    "lines": 4,
+    "size": 64,
+}
+
+
+def stats_table(tb):
+    """
+    Returns the name of the table holding the statistics of table 'tb'
+
+    :param tb: table
+    :type tb: str
+    :return: table name
+    :rtype: str
+    """
+    return f"{tb}_stats"
+
+
+def coarse(number, grain):
+    """
+    Rounds a number down or up to a multiple of 'grain' at random, up with
+    a chance proportional to the remainder.
+    The expected value is the number itself, so sums of many entries aren't
+    biased, even if most entries are shorter than a grain.
+
+    :param number: number
+    :type number: int
+    :param grain: multiple rounded to
+    :type grain: int
+    :return: rounded number
+    :rtype: int
+    """
+    lower = number - number % grain
+    if secrets.randbelow(grain) < number % grain:
+        return lower + grain
+    return lower
+
+
+def entry_stats(text):
+    """
+    Counts the words, characters, lines and UTF-8 bytes of an entry,
+    rounded by GRAINS
+
+    :param text: entry
+    :type text: str
+    :return: numbers in the order of GRAINS
+    :rtype: tuple
+    """
+    exact = {
+        "words": len(WORD.findall(text)),
+        "chars": len(text),
+        "lines": text.count("\n") + 1 if text else 0,
+        "size": len(text.encode("utf-8")),
+    }
+    return tuple(coarse(exact[name], grain) for name, grain in GRAINS.items())
+
+
+def has_stats(c, tb):
+    """
+    Checks whether table 'tb' has a statistics table
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :return: True|False
+    :rtype: bool
+    """
+    return has_table(c, stats_table(tb))
+
+
+def uncounted(c, tb):
+    """
+    Returns the number of entries statistics would count first, every entry
+    if table 'tb' has no statistics table yet
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :return: number of entries
+    :rtype: int
+    """
+    return count_missing(c, tb, stats_table(tb))
+
+
+def _count_chunk(psw, rows):
+    """
+    Decrypts the last item of each row and replaces it with its numbers
+
+    :param psw: password or session key
+    :type psw: str|SessionKey
+    :param rows: rows ending with an encrypted entry
+    :type rows: list
+    :return: rows ending with the numbers of the entry, see entry_stats()
+    :rtype: list
+    """
+    entries = decrypt_many(psw, (row[-1] for row in rows))
+    return [tuple(row[:-1]) + entry_stats(ent)
+            for row, ent in zip(rows, entries)]
+
+
+def _insert_stats(c, tb, rows):
+    """
+    Inserts or replaces the numbers of entries
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param rows: tuples containing a date and the numbers of GRAINS
+    :type rows: list
+    """
+    c.executemany(f"INSERT OR REPLACE INTO {stats_table(tb)} "
+                  f"VALUES (?, {', '.join('?' * len(GRAINS))})", rows)
+
+
+def _drop_stats(c, tb, rows):
+    """
+    Drops the numbers of entries that are gone
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param rows: tuples containing a date
+    :type rows: list
+    """
+    c.executemany(f"DELETE FROM {stats_table(tb)} WHERE date = ?", rows)
+
+
+def refresh_stats(c, tb, key, workers=None, progress=None,
+                  batch=BATCH_SIZE):
+    """
+    Counts entries written without updating the statistics, e.g. imported
+    ones, and drops the numbers of entries that are gone,
+    see d3lib.sidetables.refresh_side_table()
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param workers: number of processes decrypting, defaults to the CPU
+                    count
+    :type workers: int
+    :param progress: called with the number of entries counted so far and
+                     the number of entries missing after every batch
+    :type progress: function
+    :param batch: number of rows read and written at once
+    :type batch: int
+    :return: number of entries counted
+    :rtype: int
+    """
+    return refresh_side_table(
+        c, tb, stats_table(tb), partial(_count_chunk, key),
+        partial(_insert_stats, c, tb), partial(_drop_stats, c, tb), workers,
+        progress, batch)
+
+
+def create_stats(c, tb, key, workers=None, progress=None):
+    """
+    Creates the statistics table of table 'tb' if it doesn't exist, and
+    counts every entry missing from it, on every core.
+    Each row holds a date and the numbers of GRAINS. Nothing is committed.
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param key: session key or password
+    :type key: SessionKey|str
+    :param workers: number of processes decrypting, defaults to the CPU
+                    count
+    :type workers: int
+    :param progress: see refresh_stats()
+    :type progress: function
+    :return: number of entries counted
+    :rtype: int
+    """
+    columns = ", ".join(f"{name} INTEGER NOT NULL" for name in GRAINS)
+    c.execute(f"CREATE TABLE IF NOT EXISTS {stats_table(tb)} ("
+              f"date TEXT PRIMARY KEY, {columns}) WITHOUT ROWID")
+    return refresh_stats(c, tb, key, workers, progress)
+
+
+def count_entry(c, tb, dt, ent):
+    """
+    Replaces the numbers of an entry that was written, if table 'tb' has a
+    statistics table
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    :param ent: entry
+    :type ent: str
+    """
+    if has_stats(c, tb):
+        _insert_stats(c, tb, [(dt,) + entry_stats(ent)])
+
+
+def uncount_entry(c, tb, dt):
+    """
+    Drops the numbers of a deleted entry
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param dt: datetime
+    :type dt: str
+    """
+    if has_stats(c, tb):
+        c.execute(f"DELETE FROM {stats_table(tb)} WHERE date = ?", (dt,))
+
+
+def clear_stats(c, tb):
+    """
+    Drops every number, when every entry is deleted
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    """
+    if has_stats(c, tb):
+        c.execute(f"DELETE FROM {stats_table(tb)}")
+
+
+def totals(c, tb):
+    """
+    Returns the number of entries and the sums of their numbers, from the
+    statistics alone
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :return: values by name, "entries" and the names in GRAINS
+    :rtype: dict
+    """
+    sums = ", ".join(f"coalesce(sum({name}), 0)" for name in GRAINS)
+    c.execute(f"SELECT count(*), {sums} FROM {stats_table(tb)}")
+    return dict(zip(("entries",) + tuple(GRAINS), c.fetchone()))
+
+
+def monthly_totals(c, tb, year=None):
+    """
+    Returns the number of entries and the sums of their numbers for every
+    month that has entries, oldest first, from the statistics alone
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param year: only the months of this year, every month if None
+    :type year: int
+    :return: list of tuples containing a month like 2018-01, the number of
+             entries and the sums in the order of GRAINS
+    :rtype: list
+    """
+    sums = ", ".join(f"sum({name})" for name in GRAINS)
+    where = ""
+    params = ()
+    if year is not None:
+        # Dates sort the same as text, so the primary key finds the year
+        where = "WHERE date >= ? AND date < ? "
+        params = (f"{year:04d}", f"{year + 1:04d}")
+    c.execute(f"SELECT substr(date, 1, 7) AS month, count(*), {sums} "
+              f"FROM {stats_table(tb)} {where}GROUP BY month ORDER BY month",
+              params)
+    return c.fetchall()
+
+
+def longest_entries(c, tb, by="words", limit=10):
+    """
+    Returns the longest entries, from the statistics and the hints alone
+
+    :param c: sqlite3 Cursor instance
+    :type c: sqlite3.Cursor
+    :param tb: table
+    :type tb: str
+    :param by: one of the names in GRAINS
+    :type by: str
+    :param limit: number of entries
+    :type limit: int
+    :return: list of tuples containing a datetime, a hint and the number,
+             longest first
+    :rtype: list
+    """
+    if by not in GRAINS:
+        raise ValueError(f"Unknown statistic {by}, use one of "
+                         f"{', '.join(GRAINS)}...")
+    c.execute(f"SELECT s.date, t.hint, s.{by} FROM {stats_table(tb)} AS s "
+              f"JOIN {tb} AS t ON t.date = s.date "
+              f"ORDER BY s.{by} DESC, s.date DESC LIMIT ?", (limit,))
+    return c.fetchall()
@@ -44,7 +44,12 @@ class LineWalker(urwid.ListWalker):
     index = 0
 
     def __init__(self, txt):
-        self.text = txt.split("\n")
+        # txt is a string or an iterable of strings read only when needed
+        if isinstance(txt, str):
+            txt = [txt]
+        self.chunks = iter(txt)
+        self.rest = ""
+        self.text = []
         self.lines = []
         self.focus = 0
 
@@ -61,9 +66,24 @@ class LineWalker(urwid.ListWalker):
     def get_prev(self, start_from):
         return self._get_at_pos(start_from - 1)
 
+    def split_chunks(self, index):
+        """Split text chunks into lines until line 'index' is available."""
+
+        while len(self.text) <= index and self.rest is not None:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                # the last line has no newline after it
+                self.text.append(self.rest)
+                self.rest = None
+            else:
+                lines = (self.rest + chunk).split("\n")
+                self.rest = lines.pop()
+                self.text.extend(lines)
+
     def read_next_line(self, index):
         """Get next item from the text list."""
 
+        self.split_chunks(index)
         try:
             next_line = self.text[index]
         except IndexError:
@@ -20,28 +20,28 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import hashlib
 import os
-import shutil
 import sqlite3
 import sys
 import webbrowser
 from cli import table_name
 from d3lib.cmenu import datetime
 from d3lib.dbtools import (
-    add_entry,
-    all_entry_names,
+    DEFAULT_PROFILE,
+    PROFILES,
+    DiaryStore,
+    backup_database,
+    bulk_profile,
     change_password,
     create_database,
-    delete_entry,
     open_database,
-    single_entry,
-    valid_password,
 )
+from d3lib.search import create_index
+from d3lib.stats import create_stats
 from d3lib.gui import license_text
 from d3lib.gui.AboutDialog import Ui_Dialog
 from d3lib.gui.MainWindow import Ui_MainWindow
-from PyQt5 import QtCore, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets
 
 __author__ = "Korvin F. Ezüst"
 __copyright__ = "Copyright (c) 2018, Korvin F. Ezüst"
@@ -50,12 +50,6 @@ __version__ = "1.0.1"
 __email__ = "dev@korvin.eu"
 __status__ = "Production"
 
-# Declare variables with different initial values
-# These will store hash sums of the db file and the backup db file
-db_hash = "+"
-bak_hash = "-"
-
-
 # noinspection PyArgumentList
 class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
     def __init__(self):
@@ -76,8 +70,15 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         entry_date_list = []
         # title of each entry - hint, if any
         entry_hint_list = []
-        # password
-        password = ""
+        # open database with its session key, the password itself isn't
+        # kept
+        store = None
+        # date of the entry being displayed
+        shown_date = ""
+        # incremented every time listWidget is regenerated
+        list_version = 0
+        # connection settings, see d3lib.dbtools.PROFILES
+        profile = DEFAULT_PROFILE
         # location of current database
         database = ""
         # get table name defined in cli.py
@@ -87,8 +88,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         def change_pass():
             """Change password of database entries"""
-            global db_hash, bak_hash
-            nonlocal database, password, table
+            nonlocal database, store, table, profile
 
             # Don't do anything if there's no database open
             if database == "":
@@ -100,7 +100,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             # If Ok is pressed
             if flag:
                 # Check if given password matches the original
-                if psw == password:
+                if store.valid_password(psw):
                     # ask for new password if it is
                     new, flag = password_box("Change Password",
                                              "New password:")
@@ -118,7 +118,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                         # backup database
                         backup = BackupMessageBox(database)
                         backup.exec_()
-                        if db_hash == bak_hash:
+                        if backup.backup.result:
                             msg_box("Backup file " + database + ".bak created")
                         else:
                             msg_box("Something went wrong! "
@@ -127,9 +127,16 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
                         # change password
                         change = PasswordChangeMessageBox(
-                            database, table, password, new
+                            database, table, psw, new, profile
                         )
                         change.exec_()
+                        # nothing was written if the change failed
+                        if not change.pass_change.result:
+                            msg_box(f"Password didn't change!\n"
+                                    f"{change.pass_change.error}\n"
+                                    f"The backup file {database}.bak is "
+                                    f"intact.")
+                            return
                         # display message of successful change
                         msg_box("Password changed.")
                         # clear listWidget and textEdit
@@ -137,6 +144,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                         self.listWidget.clear()
                         self.textEdit.setText("")
                         database = ""
+                        store.close()
+                        store = None
                     else:
                         # if passwords don't match
                         # display message and leave password change
@@ -186,8 +195,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         def delete():
             """Delete an entry from the database"""
-            nonlocal database, table, password, entry_date_list
-            nonlocal entry_hint_list
+            nonlocal database, store, entry_date_list, entry_hint_list
 
             # Don't do anything if there's no database open
             if database == "":
@@ -213,14 +221,12 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                 self.listWidget.clear()
                 self.textEdit.setText("")
                 # delete entry and reload listWidget
-                with open_database(database) as cr:
-                    delete_entry(cr, table, date)
-                    refresh_list_widget(
-                        cr, table, entry_date_list, entry_hint_list)
+                store.delete_entry(date)
+                refresh_list_widget(store, entry_date_list, entry_hint_list)
 
         def delete_all():
-            """Delete database file and recreate an empty one"""
-            nonlocal database, table, password
+            """Delete every entry from the database"""
+            nonlocal database, store
 
             # Don't do anything if there's no database open
             if database == "":
@@ -239,15 +245,14 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                     "Are you sure? This cannot be undone.",
                     QtWidgets.QMessageBox.Yes,
                     QtWidgets.QMessageBox.Cancel)
-                # delete database file and recreate an empty one
+                # recreate the table of entries
                 if select == QtWidgets.QMessageBox.Yes:
-                    os.remove(database)
-                    create_database(database, table, password)
+                    store.delete_all_entries()
                     # clear listWidget and textEdit
                     self.listWidget.clear()
                     self.textEdit.setText("")
 
-        def line_input(title, text):
+        def line_input(title, text, default=""):
             """
             Displays a QInputDialog to ask for user input
 
@@ -255,11 +260,14 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             :type title: str
             :param text: text to be displayed
             :type text: str
+            :param default: text the input starts with
+            :type default: str
             :return: user input
             :rtype: str
             """
             # noinspection PyCallByClass,PyArgumentList
-            return QtWidgets.QInputDialog.getText(self, title, text)
+            return QtWidgets.QInputDialog.getText(
+                self, title, text, QtWidgets.QLineEdit.Normal, default)
 
         def msg_box(text):
             """
@@ -321,8 +329,7 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         def new_entry():
             """Create new entry in the database"""
-            nonlocal database, table, password, entry_date_list
-            nonlocal entry_hint_list
+            nonlocal database, store, entry_date_list, entry_hint_list
 
             # Don't do anything if there's no database open
             if database == "":
@@ -340,10 +347,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             date = datetime()
 
             # Add new entry and regenerate listWidget
-            with open_database(database) as cr:
-                add_entry(cr, table, date, password, "", hint)
-                refresh_list_widget(
-                    cr, table, entry_date_list, entry_hint_list)
+            store.add_entry(date, "", hint)
+            refresh_list_widget(store, entry_date_list, entry_hint_list)
             # Set listWidget's first item as selected
             self.listWidget.setCurrentRow(0)
 
@@ -358,43 +363,46 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         def open_new():
             """Choose a file"""
-            nonlocal database, table, password, entry_date_list
-            nonlocal entry_hint_list
+            nonlocal database, table, store, entry_date_list
+            nonlocal entry_hint_list, profile
 
             # Ask user to select a file,
             # don't check if Open or Cancel was pressed
-            database, _ = QtWidgets.QFileDialog.getOpenFileName()
+            name, _ = QtWidgets.QFileDialog.getOpenFileName()
 
             # If a file was selected
-            if database != "":
+            if name != "":
+                opened = None
                 try:
                     # Open database
-                    with open_database(database) as cr:
-                        # store already given password
-                        password_of_opened_db = password
-                        # ask for password
-                        password, flag = password_box("Password", "Password:")
-                        # if Ok is pressed
-                        if flag:
-                            # check if password is valid
-                            if valid_password(cr, password):
-                                # regenerate listWidget
-                                refresh_list_widget(
-                                    cr,
-                                    table,
-                                    entry_date_list,
-                                    entry_hint_list)
-                            # if invalid password
-                            else:
-                                # display message and restore password
-                                msg_box("Invalid password!")
-                                password = password_of_opened_db
+                    opened = DiaryStore(name, table, profile=profile)
+                    # ask for password
+                    psw, flag = password_box("Password", "Password:")
+                    # if Ok is pressed
+                    if flag:
+                        # check if password is valid
+                        if opened.unlock(psw):
+                            # keep the new database open instead of the
+                            # old one
+                            if store is not None:
+                                store.close()
+                            database, store, opened = name, opened, None
+                            # convert a database created by an earlier
+                            # version
+                            store.upgrade()
+                            # regenerate listWidget
+                            refresh_list_widget(
+                                store, entry_date_list, entry_hint_list)
+                        # if invalid password, display message and
+                        # keep the already opened database
                         else:
-                            # if Cancel is pressed, restore password
-                            password = password_of_opened_db
+                            msg_box("Invalid password!")
                 except sqlite3.DatabaseError:
                     # Show error message if database can't be opened
                     msg_box(db_error)
+                finally:
+                    if opened is not None:
+                        opened.close()
 
         def password_box(title, text):
             """
@@ -413,41 +421,64 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
                 self, title, text, QtWidgets.QLineEdit.Password)
             return psw, fl
 
-        def refresh_list_widget(c, tb, edl, ehl):
+        def add_names(names, edl, ehl):
             """
-            Updates the QListWidget
+            Adds entries to the QListWidget
 
-            :param c: sqlite3 Cursor instance
-            :type c: sqlite3 Cursor
-            :param tb: table name
-            :type tb: str
+            :param names: tuples containing a datetime and a hint
+            :type names: list
             :param edl: entry date list
             :type edl: list
             :param ehl: entry hint list
             :type ehl: list
             """
-            # Empty lists
-            del edl[:]
-            del ehl[:]
-            # Clear listWidget and textEdit
-            self.listWidget.clear()
-            self.textEdit.setText("")
-            # Regenerate listWidget
-            for e, h in all_entry_names(c, tb):
+            labels = []
+            for e, h in names:
                 if h != "":
                     # add date and hint
-                    self.listWidget.addItem(f"{e} -- {h}")
+                    labels.append(f"{e} -- {h}")
                 else:
                     # add hint
-                    self.listWidget.addItem(f"{e}")
+                    labels.append(f"{e}")
                 # add date and hint to lists
                 edl.append(e)
                 ehl.append(h)
+            self.listWidget.addItems(labels)
+
+        def refresh_list_widget(st, edl, ehl):
+            """
+            Updates the QListWidget
+
+            :param st: open database
+            :type st: d3lib.dbtools.DiaryStore
+            :param edl: entry date list
+            :type edl: list
+            :param ehl: entry hint list
+            :type ehl: list
+            """
+            nonlocal list_version
+
+            list_version += 1
+            version = list_version
+            # Empty lists
+            del edl[:]
+            del ehl[:]
+            # Clear listWidget, textEdit and the search results message
+            self.listWidget.clear()
+            self.textEdit.setText("")
+            self.statusbar.clearMessage()
+            # Regenerate listWidget one page at a time, the first page is
+            # shown before the rest is read
+            for names in st.entry_names():
+                # stop if listWidget got regenerated in the meantime
+                if version != list_version:
+                    return
+                add_names(names, edl, ehl)
+                QtWidgets.QApplication.processEvents()
 
         def save_entry():
             """Save entry to the database"""
-            nonlocal database, table, password, entry_date_list
-            nonlocal entry_hint_list
+            nonlocal database, store, entry_date_list, entry_hint_list
 
             # Don't do anything if there's no database open
             if database == "":
@@ -459,20 +490,208 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             # Get the selected item's index
             index = self.listWidget.selectedIndexes()[0]
             index = index.row()
-            # Get date and hint from lists based on index
+            # Get date from list based on index
             date = entry_date_list[index]
-            hint = entry_hint_list[index]
             # Get the content of textEdit
             entry = self.textEdit.toPlainText()
 
-            # Delete existing entry, if any, and create new entry
-            with open_database(database) as cr:
-                delete_entry(cr, table, date)
-                add_entry(cr, table, date, password, entry, hint)
+            # Replace the entry, nothing is written if it didn't change
+            store.update_entry(date, entry)
+
+        def show_revisions():
+            """
+            Display an earlier text of the selected entry, saving it makes
+            it the latest one again
+            """
+            nonlocal database, store, entry_date_list
+
+            # Don't do anything if there's no database open
+            if database == "":
+                return
+            # Don't do anything if listWidget is empty
+            if not self.listWidget.selectedIndexes():
+                return
+
+            index = self.listWidget.selectedIndexes()[0].row()
+            date = entry_date_list[index]
+            revisions = store.revisions(date)
+            if not revisions:
+                msg_box("This entry has never been changed.")
+                return
+            names = [f"{number}: saved {saved}"
+                     for number, saved, snapshot, size in revisions]
+            # noinspection PyCallByClass,PyArgumentList
+            name, flag = QtWidgets.QInputDialog.getItem(
+                self, "Revisions", f"Revisions of {date}:", names,
+                len(names) - 1, False)
+            # leave revisions if Cancel is pressed
+            if not flag:
+                return
+            number = revisions[names.index(name)][0]
+            self.textEdit.setText(store.revision(date, number))
+            self.statusbar.showMessage(
+                f"Revision {number} of {date}, save it to restore it")
+
+        def search():
+            """List only the entries having the words searched for"""
+            nonlocal database, store, table, entry_date_list
+            nonlocal entry_hint_list, profile, list_version
+
+            # Don't do anything if there's no database open
+            if database == "":
+                return
+
+            query, flag = line_input(
+                "Search", "Words, and beginnings of words ending with *.\n"
+                          "Leave it empty to list every entry:")
+            # leave search if Cancel is pressed
+            if not flag:
+                return
+            if query.strip() == "":
+                refresh_list_widget(store, entry_date_list, entry_hint_list)
+                return
+
+            # index the entries missing from the search index first, on
+            # another thread
+            if store.unindexed_entries():
+                indexing = IndexingMessageBox(
+                    database, table, store.key, profile)
+                indexing.exec_()
+                if not indexing.indexing.result:
+                    msg_box(f"Indexing failed!\n{indexing.indexing.error}")
+                    return
+            try:
+                found = store.search(query)
+            except ValueError as error:
+                msg_box(str(error))
+                return
+            show_names(found, f"{len(found)} found: {query}")
+
+        def calendar():
+            """
+            List only the entries of a year, a month, a day, or a day of
+            every year
+            """
+            nonlocal database, store
+
+            # Don't do anything if there's no database open
+            if database == "":
+                return
+
+            when, flag = line_input(
+                "Calendar", "Year, month or day, e.g. 2018, 2018-01 or "
+                            "2018-01-02.\nMonth and day, e.g. 01-02, for "
+                            "that day of every year:",
+                QtCore.QDate.currentDate().toString("MM-dd"))
+            # leave calendar if Cancel is pressed
+            if not flag:
+                return
+            try:
+                found = store.calendar_entries(when)
+            except ValueError as error:
+                msg_box(str(error))
+                return
+            show_names(found, f"{len(found)} on {when.strip() or 'today'}")
+
+        def show_names(names, message):
+            """
+            Stops a listing in progress and lists only 'names'
+
+            :param names: tuples containing a datetime and a hint
+            :type names: list
+            :param message: shown in the statusbar
+            :type message: str
+            """
+            nonlocal entry_date_list, entry_hint_list, list_version
+
+            list_version += 1
+            del entry_date_list[:]
+            del entry_hint_list[:]
+            self.listWidget.clear()
+            self.textEdit.setText("")
+            add_names(names, entry_date_list, entry_hint_list)
+            self.statusbar.showMessage(message)
+
+        def set_profile(name):
+            """
+            Changes the connection settings of the open database and the
+            ones opened later
+
+            :param name: profile name, see d3lib.dbtools.PROFILES
+            :type name: str
+            """
+            nonlocal store, profile
+
+            profile = name
+            if store is not None:
+                store.set_profile(profile)
+
+        def show_diagnostics():
+            """Display the connection settings and the database size"""
+            nonlocal store, profile
+
+            # Don't do anything if there's no database open
+            if store is None:
+                msg_box(f"profile: {profile}\nNo diary open.")
+                return
+            msg_box("\n".join(
+                f"{name}: {value}"
+                for name, value in store.diagnostics().items()))
+
+        def show_statistics():
+            """
+            Display the totals, the last months and the longest entries,
+            from the statistics table
+            """
+            nonlocal database, store, table, profile
+
+            # Don't do anything if there's no database open
+            if database == "":
+                return
+
+            # count the entries missing from the statistics first, on
+            # another thread
+            if store.uncounted_entries():
+                counting = CountingMessageBox(
+                    database, table, store.key, profile)
+                counting.exec_()
+                if not counting.counting.result:
+                    msg_box(f"Counting failed!\n{counting.counting.error}")
+                    return
+            total, months, longest = store.statistics(limit=5)
+            lines = [f"{total['entries']} entries, about {total['words']} "
+                     f"words, {total['chars']} characters and "
+                     f"{total['lines']} lines", "", "Last months:"]
+            for month, count, words, chars, rows, size in months[-12:]:
+                lines.append(f"{month}: {count} entries, about {words} words")
+            lines += ["", "Longest entries:"]
+            for date, hint, words in longest:
+                lines.append(f"{date} ({hint}): about {words} words")
+            msg_box("\n".join(lines))
+
+        def set_streaming(streaming):
+            """
+            Keep the entry being displayed in pieces from being edited,
+            and the database from being written, until all of it is shown
+
+            :param streaming: True while the entry is being displayed
+            :type streaming: bool
+            """
+            self.textEdit.setReadOnly(streaming)
+            for widget in (self.listWidget, self.saveButton, self.saveAction,
+                           self.deleteButton, self.deleteAction,
+                           self.deleteAllButton, self.newButton,
+                           self.newAction, self.newEntryButton,
+                           self.newEntryAction, self.openButton,
+                           self.openAction, self.changePassAction,
+                           search_action, calendar_action,
+                           revisions_action, profile_menu,
+                           diagnostics_action, statistics_action):
+                widget.setEnabled(not streaming)
 
         def show_entry():
             """Display text belonging to selected entry"""
-            nonlocal database, table, password, entry_date_list
+            nonlocal store, entry_date_list, shown_date
 
             # Don't do anything if listWidget is empty
             if not self.listWidget.selectedIndexes():
@@ -483,17 +702,62 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             index = index.row()
             # Get date based on index
             date = entry_date_list[index]
-
-            # Get the text from selected entry and display it in textEdit
-            with open_database(database) as cr:
-                entry = single_entry(cr, table, date, password)
-                self.textEdit.setText(entry)
+            shown_date = date
+
+            # Get the text from selected entry and display it in textEdit,
+            # display the first part of a long entry before decrypting
+            # the rest
+            segments = store.entry_stream(date)
+            self.textEdit.setText(next(segments, ""))
+            # a save in the meantime would store only the part shown so far
+            # and end the stream reading the entry
+            set_streaming(True)
+            try:
+                for segment in segments:
+                    QtWidgets.QApplication.processEvents()
+                    # stop if another entry got selected in the meantime
+                    if shown_date != date:
+                        break
+                    cursor = self.textEdit.textCursor()
+                    cursor.movePosition(QtGui.QTextCursor.End)
+                    cursor.insertText(segment)
+            finally:
+                segments.close()
+                set_streaming(False)
 
         def show_license():
             """Open a dialog window with the Apache 2 license"""
             dialog = LicenseText()
             dialog.exec_()
 
+        # Add menu items choosing the connection settings
+        profile_menu = QtWidgets.QMenu("Storage Profile", self.menuFile)
+        profile_group = QtWidgets.QActionGroup(profile_menu)
+        for name in PROFILES:
+            action = profile_menu.addAction(name)
+            action.setCheckable(True)
+            action.setChecked(name == profile)
+            profile_group.addAction(action)
+            action.triggered.connect(
+                lambda checked, name=name: set_profile(name))
+        self.menuFile.insertMenu(self.exitAction, profile_menu)
+        self.menuFile.insertSeparator(self.exitAction)
+        # Add a menu item searching entries
+        search_action = QtWidgets.QAction("Search...", self)
+        search_action.setShortcut("Ctrl+F")
+        self.menuFile.insertAction(self.changePassAction, search_action)
+        # Add a menu item listing the entries of some dates
+        calendar_action = QtWidgets.QAction("Calendar...", self)
+        calendar_action.setShortcut("Ctrl+D")
+        self.menuFile.insertAction(self.changePassAction, calendar_action)
+        # Add a menu item showing earlier texts of an entry
+        revisions_action = QtWidgets.QAction("Revisions...", self)
+        revisions_action.setShortcut("Ctrl+R")
+        self.menuFile.insertAction(self.changePassAction, revisions_action)
+        self.menuFile.insertSeparator(self.changePassAction)
+        diagnostics_action = self.menuHelp.addAction("Diagnostics")
+        statistics_action = self.menuHelp.addAction("Statistics")
+
         # Connect buttons, menu items and QListWidget selection
         self.aboutD3TAAction.triggered.connect(open_browser_d3ta)
         self.aboutQt5Action.triggered.connect(open_browser_qt5)
@@ -508,6 +772,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.exitButton.clicked.connect(confirm_exit)
 
         self.licenseAction.triggered.connect(show_license)
+        diagnostics_action.triggered.connect(show_diagnostics)
+        statistics_action.triggered.connect(show_statistics)
 
         self.newAction.triggered.connect(new_db)
         self.newButton.clicked.connect(new_db)
@@ -519,6 +785,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.openButton.clicked.connect(open_new)
 
         self.saveAction.triggered.connect(save_entry)
+
+        search_action.triggered.connect(search)
+        calendar_action.triggered.connect(calendar)
+        revisions_action.triggered.connect(show_revisions)
         self.saveButton.clicked.connect(save_entry)
 
         self.listWidget.itemSelectionChanged.connect(show_entry)
@@ -536,43 +806,22 @@ class LicenseText(QtWidgets.QDialog, Ui_Dialog):
 class BackingUp(QtCore.QThread):
     """Executes the copying of the database on a new thread"""
     sig = QtCore.pyqtSignal()
+    # number of pages copied so far and number of all pages
+    step = QtCore.pyqtSignal(int, int)
 
     def __init__(self, file):
         super(BackingUp, self).__init__()
         self.file = file
+        # True if the backup is made and passed the integrity check
+        self.result = False
 
     def run(self):
-        global db_hash
-        global bak_hash
-
-        def make_hash(file):
-            """
-            Creates an SHA3-256 sum from a file
-
-            :param file: file to be hashed
-            :type file: str
-            :return: hexadecimal hash string
-            :rtype: str
-            """
-            h = hashlib.sha3_256()
-            with open(file, "rb") as f:
-                while True:
-                    data = f.read(65536)
-                    if not data:
-                        break
-                    h.update(data)
-            return h.hexdigest()
-
-        # hash database
-        db_hash = make_hash(self.file)
-        # create backup
         # noinspection PyBroadException
         try:
-            shutil.copyfile(self.file, self.file + ".bak")
-            # hash backup file
-            bak_hash = make_hash(self.file + ".bak")
+            self.result = backup_database(self.file,
+                                          progress=self.step.emit)
         except Exception:
-            pass
+            self.result = False
         # send a signal when it's done
         self.sig.emit()
 
@@ -586,41 +835,189 @@ class BackupMessageBox(QtWidgets.QMessageBox):
         # disable buttons
         self.setStandardButtons(QtWidgets.QMessageBox.NoButton)
         self.backup = BackingUp(self.file)
+        self.backup.step.connect(self.show_progress)
         self.backup.start()
         # for some reason self.close doesn't work
         self.backup.sig.connect(self.reject)
 
+    def show_progress(self, done, total):
+        """
+        Displays the part of the database copied so far
 
-class ChangingPassword(QtCore.QThread):
-    """Executes the password change of the database on a new thread"""
+        :param done: number of pages copied
+        :type done: int
+        :param total: number of all pages
+        :type total: int
+        """
+        self.setText(f"Backing up database. This might take a while...\n"
+                     f"{100 * done // max(total, 1)}% copied")
+
+
+class Working(QtCore.QThread):
+    """
+    Executes work() on a new thread and sends sig when it's done, also when
+    it failed, so the message box waiting for it always closes
+    """
     sig = QtCore.pyqtSignal()
 
-    def __init__(self, file, table, old_pass, new_pass):
+    def __init__(self):
+        super(Working, self).__init__()
+        # True if work() returned without an error
+        self.result = False
+        # message of the error work() raised
+        self.error = ""
+
+    def work(self):
+        """Does the work, implemented by subclasses"""
+        raise NotImplementedError
+
+    def run(self):
+        # noinspection PyBroadException
+        try:
+            self.work()
+            self.result = True
+        except Exception as error:
+            self.result = False
+            self.error = str(error) or type(error).__name__
+        # send a signal when it's done
+        self.sig.emit()
+
+
+class ChangingPassword(Working):
+    """Executes the password change of the database on a new thread"""
+    # number of entries and revisions re-encrypted so far and number of all
+    # of them
+    step = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, file, table, old_pass, new_pass, profile):
         super(ChangingPassword, self).__init__()
         self.file = file
         self.table = table
         self.old_pass = old_pass
         self.new_pass = new_pass
+        self.profile = profile
 
-    def run(self):
-        with open_database(self.file) as cr:
-            change_password(cr, self.old_pass, self.new_pass, self.table)
-        # send signal when it's done
-        self.sig.emit()
+    def work(self):
+        # one transaction, synced to the disk when it's committed and
+        # rolled back if anything fails
+        with open_database(self.file, self.profile) as cr, \
+                bulk_profile(cr):
+            change_password(cr, self.old_pass, self.new_pass, self.table,
+                            progress=self.step.emit)
+
+
+class Indexing(Working):
+    """Executes the indexing of entries for searching on a new thread"""
+    # number of entries indexed so far and number of entries missing
+    step = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, file, table, key, profile):
+        super(Indexing, self).__init__()
+        self.file = file
+        self.table = table
+        self.key = key
+        self.profile = profile
+
+    def work(self):
+        with open_database(self.file, self.profile) as cr:
+            create_index(cr, self.table, self.key, progress=self.step.emit)
+
+
+class IndexingMessageBox(QtWidgets.QMessageBox):
+    """Displays a QMessageBox while entries are being indexed"""
+    def __init__(self, file, table, key, profile):
+        super(IndexingMessageBox, self).__init__()
+        self.setText("Indexing entries for searching...")
+        # disable buttons
+        self.setStandardButtons(QtWidgets.QMessageBox.NoButton)
+        self.indexing = Indexing(file, table, key, profile)
+        self.indexing.step.connect(self.show_progress)
+        self.indexing.start()
+        # for some reason self.close doesn't work
+        self.indexing.sig.connect(self.reject)
+
+    def show_progress(self, done, total):
+        """
+        Displays the number of entries indexed so far
+
+        :param done: number of entries indexed
+        :type done: int
+        :param total: number of entries missing from the index
+        :type total: int
+        """
+        self.setText(f"Indexing entries for searching...\n"
+                     f"{done} of {total} entries indexed")
+
+
+class Counting(Working):
+    """Executes the counting of entries for statistics on a new thread"""
+    # number of entries counted so far and number of entries missing
+    step = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, file, table, key, profile):
+        super(Counting, self).__init__()
+        self.file = file
+        self.table = table
+        self.key = key
+        self.profile = profile
+
+    def work(self):
+        with open_database(self.file, self.profile) as cr:
+            create_stats(cr, self.table, self.key, progress=self.step.emit)
+
+
+class CountingMessageBox(QtWidgets.QMessageBox):
+    """Displays a QMessageBox while entries are being counted"""
+    def __init__(self, file, table, key, profile):
+        super(CountingMessageBox, self).__init__()
+        self.setText("Counting words for statistics...")
+        # disable buttons
+        self.setStandardButtons(QtWidgets.QMessageBox.NoButton)
+        self.counting = Counting(file, table, key, profile)
+        self.counting.step.connect(self.show_progress)
+        self.counting.start()
+        # for some reason self.close doesn't work
+        self.counting.sig.connect(self.reject)
+
+    def show_progress(self, done, total):
+        """
+        Displays the number of entries counted so far
+
+        :param done: number of entries counted
+        :type done: int
+        :param total: number of entries missing from the statistics
+        :type total: int
+        """
+        self.setText(f"Counting words for statistics...\n"
+                     f"{done} of {total} entries counted")
 
 
 class PasswordChangeMessageBox(QtWidgets.QMessageBox):
     """Displays a QMessageBox while the password change is running"""
-    def __init__(self, file, table, old_pass, new_pass):
+    def __init__(self, file, table, old_pass, new_pass, profile):
         super(PasswordChangeMessageBox, self).__init__()
         self.setText("Changing password. This might take a while...")
         # disable buttons
         self.setStandardButtons(QtWidgets.QMessageBox.NoButton)
-        self.pass_change = ChangingPassword(file, table, old_pass, new_pass)
+        self.pass_change = ChangingPassword(
+            file, table, old_pass, new_pass, profile)
+        self.pass_change.step.connect(self.show_progress)
         self.pass_change.start()
         # for some reason self.close doesn't work
         self.pass_change.sig.connect(self.reject)
 
+    def show_progress(self, done, total):
+        """
+        Displays the number of entries and revisions re-encrypted so far
+
+        :param done: number of entries and revisions re-encrypted
+        :type done: int
+        :param total: number of all entries and revisions
+        :type total: int
+        """
+        self.setText(f"Changing password. This might take a while...\n"
+                     f"{done} of {total} entries and revisions re-encrypted")
+
 
 if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)